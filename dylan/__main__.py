@@ -0,0 +1,143 @@
+"""
+Stream bulk pricing of contract files:
+
+    python -m dylan contracts.csv --engine binomial --steps 101 --lattice leisen_reimer > prices.csv
+    cat contracts.jsonl | python -m dylan --format jsonl --engine black-scholes
+
+Each contract has a payoff ('call' or 'put'), spot, strike, expiry, rate, volatility and
+dividend; any other fields are passed through, and a price field is added. Contracts are read,
+priced (one batch engine call per chunk and payoff) and written chunk_size at a time, so memory
+does not grow with the input. numpy and the engines are only imported once the arguments have
+been parsed. --timing reports the start-up time (imports plus the first chunk) and throughput
+on stderr; the start-up target is half a second.
+
+"""
+
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+
+_FIELDS = ('spot', 'strike', 'expiry', 'rate', 'volatility', 'dividend')
+
+_ENGINES = ('black-scholes', 'binomial', 'american-binomial', 'monte-carlo')
+
+
+def _engine(args):
+    """
+    The pricing engine chosen on the command line.
+
+    """
+
+    from dylan import engine
+
+    if args.engine == 'black-scholes':
+        return engine.BlackScholesPricingEngine(engine.BlackScholesPricer)
+    if args.engine in ('binomial', 'american-binomial'):
+        pricer = engine.EuropeanBinomialPricer if args.engine == 'binomial' else engine.AmericanBinomialPricer
+        return engine.BinomialPricingEngine(args.steps, pricer, args.lattice, args.smoothing, args.richardson)
+    return engine.MonteCarloPricingEngine(args.paths, 1, engine.NaiveMonteCarloPricer, seed=args.seed)
+
+
+def _read(stream, fmt):
+    if fmt == 'csv':
+        return csv.DictReader(stream)
+    return (json.loads(line) for line in stream if line.strip())
+
+
+def _format(path, fmt):
+    if fmt is not None:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+def _open(path):
+    return sys.stdin if path == '-' else open(path, newline='')
+
+
+def price_chunk(engine, rows):
+    """
+    Price one chunk of contracts (a list of dicts), one engine call per payoff.
+
+    Returns an array containing the prices, in row order.
+
+    """
+
+    import numpy as np
+    from dylan.book import price_book
+
+    columns = np.array([[row[field] for field in _FIELDS] for row in rows], dtype=float)
+    return price_book(engine, [row['payoff'] for row in rows], *columns.T)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dylan', description="Price a stream of option contracts.")
+    parser.add_argument('inputs', nargs='*', default=['-'], help="CSV or JSONL contract files ('-' is stdin)")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="the input format (default: from the file name)")
+    parser.add_argument('--output', default='-', help="where to write the priced contracts ('-' is stdout)")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="contracts priced per engine call")
+    parser.add_argument('--engine', choices=_ENGINES, default='black-scholes', help="the pricing engine")
+    parser.add_argument('--steps', type=int, default=100, help="lattice time steps")
+    parser.add_argument('--lattice', choices=('crr', 'leisen_reimer', 'trinomial'), default='crr')
+    parser.add_argument('--smoothing', action='store_true', help="Black-Scholes smoothing of the lattice")
+    parser.add_argument('--richardson', action='store_true', help="Richardson extrapolation of the lattice")
+    parser.add_argument('--paths', type=int, default=100000, help="Monte Carlo paths")
+    parser.add_argument('--seed', type=int, default=None, help="Monte Carlo seed")
+    parser.add_argument('--timing', action='store_true', help="report start-up time and throughput on stderr")
+    args = parser.parse_args(argv)
+
+    engine = _engine(args)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    writer = None
+    count = 0
+    startup = None
+    try:
+        for path in args.inputs:
+            fmt = _format(path, args.format)
+            stream = _open(path)
+            try:
+                rows = _read(stream, fmt)
+                for chunk in iter(lambda: list(itertools.islice(rows, args.chunk_size)), []):
+                    try:
+                        prices = price_chunk(engine, chunk)
+                    except (KeyError, ValueError) as error:
+                        parser.exit(1, "{0}: contracts {1}-{2}: {3}\n".format(path, count + 1, count + len(chunk),
+                                                                              error))
+                    if fmt == 'csv':
+                        if writer is None:
+                            writer = csv.DictWriter(out, list(chunk[0]) + ['price'], extrasaction='ignore')
+                            writer.writeheader()
+                        writer.writerows(dict(row, price=float(price)) for (row, price) in zip(chunk, prices))
+                    else:
+                        out.writelines(json.dumps(dict(row, price=float(price))) + "\n"
+                                       for (row, price) in zip(chunk, prices))
+                    count += len(chunk)
+                    if startup is None:
+                        startup = time.perf_counter() - _START
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.timing:
+        elapsed = time.perf_counter() - _START
+        sys.stderr.write("start-up {0:.3f}s, {1} contracts in {2:.3f}s ({3:.0f}/s)\n".format(
+            startup if startup is not None else elapsed, count, elapsed, count / elapsed))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # the reader (i.e. head) went away; exit quietly, without a traceback at shutdown
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
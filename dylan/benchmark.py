@@ -0,0 +1,290 @@
+"""
+Benchmark and convergence suite for the dylan pricing engines.
+
+Every case prices one problem over a grid of problem sizes (steps, paths, batch sizes)
+and records throughput, latency percentiles, peak memory and the error against an analytic
+reference. Results are written as JSON so that runs from different commits can be compared:
+
+    python -m dylan.benchmark --output bench.json
+    python -m dylan.benchmark --output new.json --baseline bench.json
+
+"""
+
+import argparse
+import collections
+import functools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from dylan.engine import (AmericanBinomialPricer, BinomialPricingEngine, BlackScholesPricer,
+                          BlackScholesPricingEngine, ControlVariateEngine, ControlVariateMonteCarloPricer,
+                          CrankNicolsonPricer, EuropeanBinomialPricer, FiniteDifferencePricingEngine,
+                          FourierPricingEngine, HestonCOSPricer, MonteCarloPricingEngine, NaiveMonteCarloPricer,
+                          QuasiMonteCarloPricingEngine, SobolMonteCarloPricer, Workspace)
+from dylan.marketdata import MarketData
+from dylan.option import Option
+from dylan.payoff import ExoticPayoff, Lookback_Call_Payoff, VanillaPayoff, call_payoff, put_payoff
+
+
+BenchmarkCase = collections.namedtuple('BenchmarkCase', ['name', 'parameter', 'sizes', 'run', 'units', 'reference'])
+"""
+A benchmark case.
+
+Attributes:
+    name (str):           the case name (usually the pricer)
+    parameter (str):      what the problem size counts (i.e. steps, paths or contracts)
+    sizes (list):         the problem sizes to run
+    run (function):       run(size) prices the problem once and returns the price (or a price array)
+    units (function):     units(size) is the amount of work per run, for throughput (i.e. nodes or paths)
+    reference (function): reference(size) is the analytic price (or price array), or None when there is none
+
+"""
+
+
+SPOT = 41.0
+STRIKE = 40.0
+RATE = 0.08
+VOLATILITY = 0.30
+DIVIDEND = 0.0
+EXPIRY = 1.0
+SEED = 20240101
+
+
+def _data():
+    return MarketData(RATE, SPOT, VOLATILITY, DIVIDEND)
+
+
+def _call():
+    return VanillaPayoff(EXPIRY, STRIKE, call_payoff)
+
+
+def _black_scholes_call(size):
+    return Option(_call(), BlackScholesPricingEngine(BlackScholesPricer), _data()).price()
+
+
+def _first(result):
+    return result[0] if isinstance(result, tuple) else result
+
+
+@functools.lru_cache(maxsize=None)
+def _batch(size):
+    rng = np.random.default_rng(SEED)
+    return (rng.uniform(0.8, 1.2, size) * SPOT, rng.uniform(0.8, 1.2, size) * STRIKE)
+
+
+def _black_scholes_batch(size):
+    engine = BlackScholesPricingEngine(BlackScholesPricer)
+    return engine.calculate_batch(call_payoff, *_batch(size), EXPIRY, RATE, VOLATILITY, DIVIDEND)
+
+
+def _heston_surface(size, xi):
+    # size strikes at each of ten expiries, with a flat variance term structure
+    strike = np.linspace(0.7, 1.3, size) * STRIKE
+    expiry = np.linspace(0.1, 2.0, 10)[:, np.newaxis]
+    engine = FourierPricingEngine(2.0, VOLATILITY ** 2, xi, HestonCOSPricer, rho=-0.5)
+    return engine.calculate(VanillaPayoff(expiry, strike, call_payoff), _data())
+
+
+def _heston_call(size):
+    # the COS price of the ControlVariateHestonCall problem: the simulation starts its variance
+    # at Vbar, which is VOLATILITY ** 2 here, and draws uncorrelated asset and variance shocks
+    return FourierPricingEngine(2.0, VOLATILITY ** 2, 0.3, HestonCOSPricer).calculate(_call(), _data())
+
+
+def _black_scholes_surface(size):
+    strike = np.linspace(0.7, 1.3, size) * STRIKE
+    expiry = np.linspace(0.1, 2.0, 10)[:, np.newaxis]
+    engine = BlackScholesPricingEngine(BlackScholesPricer)
+    return engine.calculate(VanillaPayoff(expiry, strike, call_payoff), _data())
+
+
+def default_cases(quick=False):
+    """
+    The benchmark cases for the engines in dylan.engine.
+
+    Args:
+        quick (bool): use smaller problem sizes
+
+    """
+
+    def sizes(full, short):
+        return short if quick else full
+
+    binomial_batch = BinomialPricingEngine(200, EuropeanBinomialPricer)
+    workspace = Workspace()
+    cases = [
+        BenchmarkCase('EuropeanBinomialPricer', 'steps', sizes([50, 100, 500, 1000, 5000], [50, 500]),
+                      lambda n: Option(_call(), BinomialPricingEngine(n, EuropeanBinomialPricer), _data()).price(),
+                      lambda n: n + 1, _black_scholes_call),
+        BenchmarkCase('LeisenReimerEuropean', 'steps', sizes([25, 51, 101, 201], [25, 101]),
+                      lambda n: Option(_call(), BinomialPricingEngine(n, EuropeanBinomialPricer, 'leisen_reimer'),
+                                       _data()).price(),
+                      lambda n: n + 1, _black_scholes_call),
+        BenchmarkCase('SmoothedTrinomialEuropean', 'steps',
+                      sizes([25, 50, 100, 200], [25, 100]),
+                      lambda n: Option(_call(), BinomialPricingEngine(n, EuropeanBinomialPricer, 'trinomial',
+                                                                      smoothing=True, richardson=True),
+                                       _data()).price(),
+                      lambda n: (n + 1) ** 2 + (n // 2 + 1) ** 2, _black_scholes_call),
+        BenchmarkCase('AmericanBinomialPricer', 'steps', sizes([100, 1000, 5000], [100, 1000]),
+                      lambda n: Option(VanillaPayoff(EXPIRY, STRIKE, put_payoff),
+                                       BinomialPricingEngine(n, AmericanBinomialPricer), _data()).price(),
+                      lambda n: (n + 1) * (n + 2) // 2, None),
+        BenchmarkCase('EuropeanBinomialBatchPricer', 'contracts', sizes([100, 1000, 10000], [100, 1000]),
+                      lambda n: binomial_batch.calculate_batch(call_payoff, *_batch(n), EXPIRY, RATE, VOLATILITY,
+                                                               DIVIDEND),
+                      lambda n: n, _black_scholes_batch),
+        BenchmarkCase('BlackScholesPricer', 'contracts', sizes([1000, 100000, 1000000], [1000, 100000]),
+                      _black_scholes_batch, lambda n: n, None),
+        BenchmarkCase('NaiveMonteCarloPricer', 'paths', sizes([10000, 100000, 1000000], [10000, 100000]),
+                      lambda n: Option(_call(), MonteCarloPricingEngine(n, 1, NaiveMonteCarloPricer, seed=SEED),
+                                       _data()).price(),
+                      lambda n: n, _black_scholes_call),
+        BenchmarkCase('NaiveMonteCarloFloat32', 'paths', sizes([10000, 100000, 1000000], [10000, 100000]),
+                      lambda n: Option(_call(), MonteCarloPricingEngine(n, 1, NaiveMonteCarloPricer, seed=SEED,
+                                                                        dtype=np.float32, workspace=workspace),
+                                       _data()).price(),
+                      lambda n: n, _black_scholes_call),
+        BenchmarkCase('SobolMonteCarloPricer', 'paths', sizes([1024, 8192, 65536], [1024, 8192]),
+                      lambda n: Option(_call(), QuasiMonteCarloPricingEngine(n // 16, 1, SobolMonteCarloPricer,
+                                                                             seed=SEED), _data()).price(),
+                      lambda n: n, _black_scholes_call),
+        BenchmarkCase('CrankNicolsonPricer', 'space_steps', sizes([100, 400, 1600], [100, 400]),
+                      lambda n: Option(_call(), FiniteDifferencePricingEngine(n, n // 2, CrankNicolsonPricer),
+                                       _data()).price(),
+                      lambda n: n * (n // 2), _black_scholes_call),
+        BenchmarkCase('ControlVariateMonteCarloPricer', 'paths', sizes([1000, 10000, 100000], [1000, 10000]),
+                      lambda n: Option(ExoticPayoff(EXPIRY, STRIKE, Lookback_Call_Payoff),
+                                       ControlVariateEngine(n, 10, 5.0, 0.02, 0.52, ControlVariateMonteCarloPricer,
+                                                            seed=SEED), _data()).price(),
+                      lambda n: n * 10, None),
+        BenchmarkCase('ControlVariateHestonCall', 'paths', sizes([1000, 10000, 100000], [1000, 10000]),
+                      lambda n: Option(_call(), ControlVariateEngine(n, 50, 2.0, VOLATILITY ** 2, 0.3,
+                                                                     ControlVariateMonteCarloPricer, seed=SEED),
+                                       _data()).price(),
+                      lambda n: n * 50, _heston_call),
+        BenchmarkCase('HestonCOSPricer', 'strikes', sizes([10, 100, 1000], [10, 100]),
+                      lambda n: _heston_surface(n, 0.5), lambda n: n * 10, None),
+        BenchmarkCase('HestonCOSPricerBlackScholesLimit', 'strikes', sizes([10, 100], [10]),
+                      lambda n: _heston_surface(n, 0.0), lambda n: n * 10, _black_scholes_surface),
+    ]
+    return cases
+
+
+def run_case(case, repeats=5):
+    """
+    Run one case over its problem sizes.
+
+    Returns a list of result dicts, one per size.
+
+    """
+
+    results = []
+    for size in case.sizes:
+        reference = case.reference(size) if case.reference is not None else None
+        case.run(size)
+        latencies = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            price = case.run(size)
+            latencies.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        case.run(size)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        latencies = np.array(latencies)
+        value = _first(price)
+        result = {
+            'case': case.name,
+            'parameter': case.parameter,
+            'size': size,
+            'repeats': repeats,
+            'latency_p50': float(np.percentile(latencies, 50)),
+            'latency_p90': float(np.percentile(latencies, 90)),
+            'latency_p99': float(np.percentile(latencies, 99)),
+            'throughput': float(case.units(size) / np.median(latencies)),
+            'peak_memory_bytes': int(peak),
+            'price': float(value) if np.ndim(value) == 0 else None,
+            'error': float(np.max(np.abs(value - reference))) if reference is not None else None,
+        }
+        if isinstance(price, tuple) and len(price) > 1 and np.ndim(price[1]) == 0:
+            result['stderr'] = float(price[1])
+        results.append(result)
+    return results
+
+
+def run(cases, repeats=5, stream=sys.stdout):
+    """
+    Run the benchmark cases and return the report (a JSON-ready dict).
+
+    """
+
+    report = {'metadata': _metadata(repeats), 'results': []}
+    for case in cases:
+        for result in run_case(case, repeats):
+            report['results'].append(result)
+            if stream is not None:
+                _print_result(result, stream)
+    return report
+
+
+def compare(report, baseline, stream=sys.stdout):
+    """
+    Print the median latency of each result relative to a baseline report.
+
+    """
+
+    previous = {(r['case'], r['size']): r for r in baseline['results']}
+    for result in report['results']:
+        old = previous.get((result['case'], result['size']))
+        if old is None:
+            continue
+        ratio = result['latency_p50'] / old['latency_p50']
+        stream.write("{0:<32} {1:>10} {2:>8.2f}x latency vs baseline\n".format(result['case'], result['size'], ratio))
+
+
+def _metadata(repeats):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'repeats': repeats,
+            'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform()}
+
+
+def _print_result(result, stream):
+    fmt = "{case:<32} {parameter:>11}={size:<9} p50 {latency_p50:10.6f}s  {throughput:14.1f}/s  peak {peak_memory_bytes:>12}B"
+    line = fmt.format(**result)
+    if result['error'] is not None:
+        line += "  error {0:.2e}".format(result['error'])
+    stream.write(line + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dylan pricing engines.")
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--baseline', help="compare against a previous JSON report")
+    parser.add_argument('--repeats', type=int, default=5, help="timed runs per problem size")
+    parser.add_argument('--quick', action='store_true', help="use smaller problem sizes")
+    args = parser.parse_args(argv)
+
+    report = run(default_cases(args.quick), args.repeats)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Pricing of books of contracts, shared by the command line (python -m dylan), the quote service
+and scenario revaluation.
+
+Vectorized engines price a whole book in one call with the market data as columns; the rest
+are called once per contract.
+
+"""
+
+import copy
+
+import numpy as np
+
+from dylan.marketdata import MarketData
+from dylan.payoff import VanillaPayoff, call_payoff, put_payoff
+
+
+PAYOFFS = {'call': call_payoff, 'put': put_payoff}
+"""
+The vanilla payoff functions by name.
+
+"""
+
+
+def price_book(engine, payoffs, spot, strike, expiry, rate, volatility, dividend):
+    """
+    The prices of a book of vanilla contracts, one engine call per payoff name where the engine allows.
+
+    Args:
+        engine (PricingEngine): the pricing engine
+        payoffs (array):        the payoff names (keys of PAYOFFS, i.e. 'call' or 'put')
+        spot (array):           the underlying asset cash prices
+        strike (array):         the option strike prices
+        expiry (array):         the option expiration dates
+        rate (array):           the risk-free rates
+        volatility (array):     the underlying asset volatilities
+        dividend (array):       the dividend yields
+
+    Raises ValueError for an unknown payoff name.
+
+    Returns an array containing the prices, in contract order.
+
+    """
+
+    payoffs = np.ravel(payoffs)
+    columns = [np.broadcast_to(np.asarray(x, dtype=float), payoffs.shape)
+               for x in (spot, strike, expiry, rate, volatility, dividend)]
+    prices = np.empty(payoffs.shape)
+    for name in np.unique(payoffs):
+        if name not in PAYOFFS:
+            raise ValueError("unknown payoff: {0}".format(name))
+        rows = np.flatnonzero(payoffs == name)
+        (s, k, t, r, v, q) = (x[rows] for x in columns)
+        prices[rows] = price_contracts(engine, VanillaPayoff(t, k, PAYOFFS[name]), s, r, v, q)
+    return prices
+
+
+def price_contracts(engine, option, spot, rate, volatility, dividend):
+    """
+    The prices of an option under rows of market data.
+
+    The option's strike and expiry are either scalars or arrays with one entry per row, so an
+    option may stand for a book of contracts or for one position under many scenarios.
+
+    Args:
+        engine (PricingEngine): the pricing engine
+        option (Payoff):        an option payoff via the Payoff interface
+        spot (array):           the underlying asset cash prices
+        rate (array):           the risk-free rates
+        volatility (array):     the underlying asset volatilities
+        dividend (array):       the dividend yields
+
+    Returns an array containing one price per row.
+
+    """
+
+    rows = max(np.size(x) for x in (spot, rate, volatility, dividend, option.strike, option.expiry))
+    row = lambda x: np.broadcast_to(np.ravel(np.asarray(x, dtype=float)), (rows,))
+    (spot, rate, volatility, dividend) = (row(x) for x in (spot, rate, volatility, dividend))
+    if engine.vectorized:
+        column = lambda x: row(x).reshape(-1, 1)
+        data = MarketData(column(rate), column(spot), column(volatility), column(dividend))
+        return np.ravel(_price_of(engine.calculate(_with_terms(option, column), data))).copy()
+
+    return np.array([_price_of(engine.calculate(_with_terms(option, lambda x: row(x)[i]),
+                                                MarketData(rate[i], spot[i], volatility[i], dividend[i])))
+                     for i in range(rows)], dtype=float)
+
+
+def _with_terms(option, select):
+    """
+    The option itself if its strike and expiry are scalars, else a copy with select applied to the arrays.
+
+    """
+
+    if np.ndim(option.strike) == 0 and np.ndim(option.expiry) == 0:
+        return option
+    option = copy.copy(option)
+    if np.ndim(option.strike):
+        option.strike = select(option.strike)
+    if np.ndim(option.expiry):
+        option.expiry = select(option.expiry)
+    return option
+
+
+def _price_of(result):
+    """
+    The price from an engine result, which may be a tuple led by the price.
+
+    """
+
+    return result[0] if isinstance(result, tuple) else result
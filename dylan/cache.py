@@ -0,0 +1,94 @@
+import collections
+
+import numpy as np
+
+
+class PricingCache(object):
+    """
+    A bounded least-recently-used cache of option prices.
+
+    Entries are keyed on the payoff, pricing engine and market data objects together with
+    their version counters, so setting any of their properties makes the old entries
+    unreachable; those stale entries are then evicted as the cache fills.
+
+    Writes into arrays in place bump no version, so array-valued market data (including a
+    MarketDataStore) and payoffs with array strikes or expiries are never cached: they are
+    recalculated on every call, like unseeded Monte Carlo engines.
+
+    Args:
+        maxsize (int): the maximum number of cached prices
+
+    """
+
+    def __init__(self, maxsize=1024):
+        self.__maxsize = maxsize
+        self.__entries = collections.OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    @property
+    def evictions(self):
+        return self.__evictions
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def price(self, payoff, engine, data):
+        """
+        The cached price of the option, calculating and storing it on a miss.
+
+        Engines that are not cacheable (i.e. unseeded Monte Carlo) and array-valued payoffs or
+        market data are always recalculated.
+
+        """
+
+        if not engine.cacheable or not _scalar(payoff, data):
+            return engine.calculate(payoff, data)
+
+        key = (payoff, payoff.version, engine, engine.version, data, data.version)
+        if key in self.__entries:
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+            return self.__entries[key]
+
+        self.__misses += 1
+        price = engine.calculate(payoff, data)
+        self.__entries[key] = price
+        if len(self.__entries) > self.__maxsize:
+            self.__entries.popitem(last=False)
+            self.__evictions += 1
+        return price
+
+    def clear(self):
+        self.__entries.clear()
+
+    def stats(self):
+        """
+        The cache statistics as a dict of hits, misses, evictions, size and maxsize.
+
+        """
+
+        return {'hits': self.__hits, 'misses': self.__misses, 'evictions': self.__evictions,
+                'size': len(self.__entries), 'maxsize': self.__maxsize}
+
+
+def _scalar(payoff, data):
+    """
+    Whether the payoff terms and the market data are all scalars, which no in-place write can change.
+
+    """
+
+    return all(np.ndim(x) == 0 for x in (payoff.strike, payoff.expiry) + tuple(data.get_data()))
@@ -0,0 +1,71 @@
+import collections
+import numpy as np
+from dylan.engine import FourierPricingEngine, HestonCOSPricer
+from dylan.marketdata import MarketData
+
+
+HestonParameters = collections.namedtuple('HestonParameters', ['alpha', 'Vbar', 'xi', 'rho', 'v0', 'rmse',
+                                                               'evaluations', 'success'])
+"""
+The result of a Heston calibration.
+
+Attributes:
+    alpha (float):     the variance mean-reversion speed
+    Vbar (float):      the long-run variance
+    xi (float):        the volatility of variance
+    rho (float):       the correlation between the asset and variance shocks
+    v0 (float):        the initial variance
+    rmse (float):      the root mean square (weighted) pricing error at the fit
+    evaluations (int): the number of surface repricings used
+    success (bool):    whether the optimizer reports convergence
+
+"""
+
+
+_LOWER = (1e-4, 1e-4, 1e-3, -0.999, 1e-4)
+
+_UPPER = (50.0, 4.0, 5.0, 0.999, 4.0)
+
+
+def HestonCalibration(option, data, price, guess=(2.0, 0.04, 0.5, -0.5, 0.04), weights=None, terms=256,
+                      truncation=16.0, tol=1e-10, max_evaluations=1000):
+    """
+    Fit the Heston parameters (alpha, Vbar, xi, rho, v0) to a surface of option prices.
+
+    Every trial repricing of the surface is a single vectorized FourierPricingEngine call, in
+    which each expiry costs one set of characteristic function evaluations. The fit is a
+    bounded nonlinear least squares (scipy.optimize.least_squares) on the weighted price
+    errors. A surface of a few hundred quotes calibrates in about a second.
+
+    Args:
+        option (Payoff):        a vanilla option payoff whose strike and expiry are arrays (the surface)
+        data (MarketData):      the market data; its volatility is not used
+        price (array):          the quoted option prices
+        guess (tuple):          the starting (alpha, Vbar, xi, rho, v0)
+        weights (array):        weights on the price errors (i.e. inverse vegas); default one each
+        terms (int):            the number of COS expansion terms
+        truncation (float):     the COS integration half-width in standard deviations
+        tol (float):            the optimizer's tolerance on the cost, parameters and gradient
+        max_evaluations (int):  the largest number of surface repricings
+
+    Returns a HestonParameters tuple of (alpha, Vbar, xi, rho, v0, rmse, evaluations, success).
+
+    """
+
+    from scipy.optimize import least_squares
+
+    (spot, rate, volatility, dividend) = data.get_data()
+    price = np.asarray(price, dtype=float)
+    weights = np.ones(price.shape) if weights is None else np.asarray(weights, dtype=float)
+
+    def residuals(parameters):
+        (alpha, Vbar, xi, rho, v0) = parameters
+        engine = FourierPricingEngine(alpha, Vbar, xi, HestonCOSPricer, rho, terms, truncation)
+        model = engine.calculate(option, MarketData(rate, spot, np.sqrt(v0), dividend))
+        return np.ravel(weights * (model - price))
+
+    fit = least_squares(residuals, np.clip(guess, _LOWER, _UPPER), bounds=(_LOWER, _UPPER), x_scale='jac',
+                        ftol=tol, xtol=tol, gtol=tol, max_nfev=max_evaluations)
+    rmse = np.sqrt(np.mean(fit.fun * fit.fun))
+
+    return HestonParameters(*fit.x, rmse, fit.nfev, fit.success)
@@ -1,6 +1,13 @@
 import abc
+import collections
+import functools
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from scipy.stats import binom, norm
+from dylan import instrument
+from dylan.marketdata import MarketData
+from dylan.payoff import BarrierPayoff, ExoticPayoff, VanillaPayoff, call_payoff, put_payoff
 
 
 class PricingEngine(object, metaclass=abc.ABCMeta):
@@ -9,6 +16,59 @@ class PricingEngine(object, metaclass=abc.ABCMeta):
 
     """
 
+    _version = 0
+
+    @property
+    def version(self):
+        """
+        A counter that is bumped whenever one of the engine's parameters is set.
+
+        """
+
+        return self._version
+
+    @property
+    def cacheable(self):
+        """
+        Whether the engine's prices may be memoized (i.e. it is deterministic).
+
+        """
+
+        return True
+
+    @property
+    def vectorized(self):
+        """
+        Whether calculate accepts market data arrays, returning one price per element.
+
+        """
+
+        return False
+
+    @property
+    def pricer(self):
+        """
+        The engine's pricer function, or None for engines without one.
+
+        """
+
+        return None
+
+    def work(self, option, data, result):
+        """
+        The work done by one calculate call, as a (unit, count) pair such as ('paths', 100000).
+
+        Used by the instrumentation in dylan.instrument; None when the engine does not say.
+
+        """
+
+        return None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'calculate' in cls.__dict__ and not getattr(cls.calculate, '__isabstractmethod__', False):
+            cls.calculate = instrument.instrumented(cls.calculate)
+
     @abc.abstractmethod
     def calculate(self):
         """
@@ -26,17 +86,36 @@ class BinomialPricingEngine(PricingEngine):
     """
     A concrete PricingEngine class that implements the Binomial model.
 
-    Args:
-        
+    The lattice parameterization is selectable. 'crr' is the drift-adjusted Cox-Ross-Rubinstein
+    tree, whose error oscillates with the step count. 'leisen_reimer' matches the tree to the
+    Black-Scholes d1 and d2 by Peizer-Pratt inversion, so European errors fall off as 1/steps**2
+    (steps is rounded up to an odd number). 'trinomial' uses a three-branch log-spot lattice.
 
-    Attributes:
+    smoothing replaces the last step of the lattice with Black-Scholes values, which removes the
+    oscillation from the payoff kink (for call and put payoffs); Leisen-Reimer trees already
+    avoid it and ignore smoothing. richardson extrapolates from the prices at steps and
+    steps // 2. Extrapolating an oscillating error makes it worse, so richardson turns on
+    smoothing for 'crr' and 'trinomial' lattices (the BBSR method). Smoothing (with or without
+    richardson) or Leisen-Reimer trees reach penny accuracy in 50-100 steps.
 
+    Args:
+        steps (int):       the number of time steps
+        pricer (function): a lattice pricer (i.e. EuropeanBinomialPricer or AmericanBinomialPricer)
+        lattice (str):     one of 'crr', 'leisen_reimer' or 'trinomial'
+        smoothing (bool):  use Black-Scholes values at the last time step
+        richardson (bool): apply two-point Richardson extrapolation in the step count (with smoothing,
+                           except on Leisen-Reimer trees)
 
     """
 
-    def __init__(self, steps, pricer):
+    def __init__(self, steps, pricer, lattice='crr', smoothing=False, richardson=False):
+        if lattice not in _LATTICES:
+            raise ValueError("unknown lattice: {0}".format(lattice))
         self.__steps = steps
         self.__pricer = pricer
+        self.__lattice = lattice
+        self.__smoothing = smoothing
+        self.__richardson = richardson
 
     @property
     def steps(self):
@@ -45,15 +124,93 @@ class BinomialPricingEngine(PricingEngine):
     @steps.setter
     def steps(self, new_steps):
         self.__steps = new_steps
+        self._version += 1
+
+    @property
+    def lattice(self):
+        return self.__lattice
+
+    @lattice.setter
+    def lattice(self, new_lattice):
+        if new_lattice not in _LATTICES:
+            raise ValueError("unknown lattice: {0}".format(new_lattice))
+        self.__lattice = new_lattice
+        self._version += 1
+
+    @property
+    def smoothing(self):
+        return self.__smoothing
+
+    @smoothing.setter
+    def smoothing(self, new_smoothing):
+        self.__smoothing = new_smoothing
+        self._version += 1
+
+    @property
+    def richardson(self):
+        return self.__richardson
+
+    @richardson.setter
+    def richardson(self, new_richardson):
+        self.__richardson = new_richardson
+        self._version += 1
+
+    @property
+    def vectorized(self):
+        return self.__pricer is EuropeanBinomialPricer
+
+    @property
+    def pricer(self):
+        return self.__pricer
+
+    def work(self, option, data, result):
+        steps = [_lattice_steps(self.__lattice, self.__steps)]
+        if self.__richardson:
+            steps.append(_lattice_steps(self.__lattice, self.__steps // 2))
+        if self.__lattice == 'trinomial':
+            nodes = sum((n + 1) ** 2 for n in steps)
+        elif self.vectorized:
+            nodes = sum(n + 1 for n in steps)
+        else:
+            nodes = sum((n + 1) * (n + 2) // 2 for n in steps)
+        return ('nodes', nodes * _contracts(option, data) if self.vectorized else nodes)
 
     def calculate(self, option, data):
         return self.__pricer(self, option, data)
 
+    def calculate_batch(self, payoff, spot, strike, expiry, rate, volatility, dividend):
+        """
+        Price a book of European contracts in vectorized passes.
+
+        Only engines built with EuropeanBinomialPricer have a batch path; the others raise
+        ValueError rather than price the book as European. The book goes through calculate
+        (and so EuropeanBinomialBatchPricer), which keeps it visible to dylan.instrument.
+
+        Returns an array containing the option prices.
+
+        """
+
+        if self.__pricer is not EuropeanBinomialPricer:
+            raise ValueError("calculate_batch prices European contracts; price {0} contracts with "
+                             "calculate".format(getattr(self.__pricer, '__name__', self.__pricer)))
+        (spot, strike, expiry, rate, volatility, dividend) = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (spot, strike, expiry, rate, volatility, dividend)))
+        return self.calculate(VanillaPayoff(expiry, strike, payoff), MarketData(rate, spot, volatility, dividend))
+
+
+_LATTICES = frozenset(['crr', 'leisen_reimer', 'trinomial'])
+
+_BATCH_NODES = 1 << 20
+
 
 def EuropeanBinomialPricer(pricing_engine, option, data):
     """
     The binomial option pricing model for a plain vanilla European option.
 
+    The strike, expiry and market data may be arrays of any broadcastable shapes (i.e. a
+    MarketDataStore); such contracts are priced by EuropeanBinomialBatchPricer, and the
+    prices come back in the broadcast shape.
+
     Args:
         pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
         option (Payoff):                an option payoff via the Payoff interface
@@ -61,35 +218,399 @@ def EuropeanBinomialPricer(pricing_engine, option, data):
 
     """
 
-    expiry = option.expiry
-    strike = option.strike
+    _reject_path_payoff(option, "lattices")
     (spot, rate, volatility, dividend) = data.get_data()
-    steps = pricing_engine.steps
-    nodes = steps + 1
-    dt = expiry / steps 
-    u = np.exp((rate * dt) + volatility * np.sqrt(dt)) 
-    d = np.exp((rate * dt) - volatility * np.sqrt(dt))
-    pu = (np.exp(rate * dt) - d) / (u - d)
-    pd = 1 - pu
-    disc = np.exp(-rate * expiry)
-    spotT = 0.0
-    payoffT = 0.0
-    
-    for i in range(nodes):
-        spotT = spot * (u ** (steps - i)) * (d ** (i))
-        payoffT += option.payoff(spotT)  * binom.pmf(steps - i, steps, pu)  
-    price = disc * payoffT 
-     
-    return price 
-    
+    contract = (spot, option.strike, option.expiry, rate, volatility, dividend)
+    if any(np.ndim(x) for x in contract):
+        return EuropeanBinomialBatchPricer(pricing_engine, option.payoff_function, *contract)
+
+    return _european_lattice(pricing_engine, option, spot, option.expiry, rate, volatility, dividend)
+
+
+def EuropeanBinomialBatchPricer(pricing_engine, payoff, spot, strike, expiry, rate, volatility, dividend):
+    """
+    The binomial option pricing model for a book of plain vanilla European options.
+
+    Contracts are priced in vectorized passes over (contracts x nodes) grids of about
+    _BATCH_NODES nodes each, so memory stays bounded for large books at large step counts.
+    The market data arguments may be scalars or arrays; they are broadcast against each other.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        payoff (function):              a vanilla payoff function (i.e. call_payoff or put_payoff)
+        spot (array):                   the underlying asset cash prices
+        strike (array):                 the option strike prices
+        expiry (array):                 the option expiration dates
+        rate (array):                   the risk-free rates
+        volatility (array):             the underlying asset volatilities
+        dividend (array):               the dividend yields
+
+    Returns an array containing the option prices.
+
+    """
+
+    (spot, strike, expiry, rate, volatility, dividend) = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (spot, strike, expiry, rate, volatility, dividend)))
+    shape = spot.shape
+    chunk = max(1, _BATCH_NODES // (2 * _lattice_steps(pricing_engine.lattice, pricing_engine.steps) + 1))
+    price = np.empty(spot.size)
+    for start in range(0, spot.size, chunk):
+        column = lambda x: x.reshape(-1, 1)[start:start + chunk]
+        option = VanillaPayoff(column(expiry), column(strike), payoff)
+        price[start:start + chunk] = _european_lattice(pricing_engine, option, column(spot), column(expiry),
+                                                       column(rate), column(volatility), column(dividend)).ravel()
+
+    return price.reshape(shape)
+
+
+def _european_lattice(pricing_engine, option, spot, expiry, rate, volatility, dividend):
+    """
+    Price a European option on the engine's lattice, with its smoothing and extrapolation.
+
+    """
+
+    lattice = pricing_engine.lattice
+    smoothing = _smoothing(pricing_engine)
+    if lattice == 'trinomial':
+        price = lambda steps: _trinomial_backward_induction(option, spot, rate, volatility, dividend, steps,
+                                                            np.zeros(steps, dtype=bool), smoothing)
+    else:
+        price = lambda steps: _european_binomial(option, spot, expiry, rate, volatility, dividend, steps,
+                                                 lattice, smoothing)
+
+    return _richardson(pricing_engine, price, 2 if lattice == 'leisen_reimer' else 1)
+
+
+def _reject_path_payoff(option, method):
+    """
+    Raise ValueError for a path-dependent (ExoticPayoff) option, which method cannot price.
+
+    """
+
+    if isinstance(option, ExoticPayoff):
+        raise ValueError("{0} price vanilla payoffs, not {1}".format(method, type(option).__name__))
+
+
+def _smoothing(pricing_engine):
+    """
+    Whether the lattice smooths its last step: when asked to, and always under Richardson
+    extrapolation, which needs a smooth error in the step count; never on Leisen-Reimer trees.
+
+    """
+
+    return (pricing_engine.smoothing or pricing_engine.richardson) and pricing_engine.lattice != 'leisen_reimer'
+
+
+def _lattice_steps(lattice, steps):
+    """
+    The number of steps actually used: Leisen-Reimer trees need an odd number.
+
+    """
+
+    return steps + 1 - steps % 2 if lattice == 'leisen_reimer' else steps
+
+
+def _richardson(pricing_engine, price, order):
+    """
+    Call price(steps) at the engine's step count, extrapolating from half the steps if asked to.
+
+    The extrapolation assumes the error falls off as 1/steps**order.
+
+    """
+
+    lattice = pricing_engine.lattice
+    fine = _lattice_steps(lattice, pricing_engine.steps)
+    if not pricing_engine.richardson:
+        return price(fine)
+
+    coarse = _lattice_steps(lattice, pricing_engine.steps // 2)
+    (wf, wc) = (fine ** order, coarse ** order)
+
+    return (wf * price(fine) - wc * price(coarse)) / (wf - wc)
+
+
+def _peizer_pratt(z, steps):
+    """
+    The Peizer-Pratt (method 2) inversion of the normal distribution onto a binomial one.
+
+    """
+
+    x = z / (steps + 1.0 / 3.0 + 0.1 / (steps + 1.0))
+    return 0.5 + np.copysign(np.sqrt(0.25 - 0.25 * np.exp(-x * x * (steps + 1.0 / 6.0))), z)
+
+
+def _binomial_moves(option, spot, expiry, rate, volatility, dividend, steps, lattice):
+    """
+    The log up move, log down move and up probability of one step of a binomial lattice.
+
+    """
+
+    dt = expiry / steps
+    drift = (rate - dividend) * dt
+    if lattice == 'leisen_reimer':
+        (d1, d2) = _black_scholes_d1_d2(spot, option.strike, expiry, volatility, rate, dividend)
+        pu = _peizer_pratt(d2, steps)
+        u = np.exp(drift) * _peizer_pratt(d1, steps) / pu
+        d = (np.exp(drift) - pu * u) / (1.0 - pu)
+        return (np.log(u), np.log(d), pu)
+
+    logu = drift + volatility * np.sqrt(dt)
+    logd = drift - volatility * np.sqrt(dt)
+    pu = (np.exp(drift) - np.exp(logd)) / (np.exp(logu) - np.exp(logd))
+    return (logu, logd, pu)
+
+
+def _terminal_values(option, spots, dt, rate, volatility, dividend, smoothing):
+    """
+    The option values at the last level of a lattice: the payoff, or with smoothing the
+    Black-Scholes value one step (dt) before expiry.
+
+    """
+
+    if smoothing:
+        return _black_scholes_price(option, spots, dt, rate, volatility, dividend)
+    return option.payoff(spots)
+
+
+def _european_binomial(option, spot, expiry, rate, volatility, dividend, steps, lattice='crr', smoothing=False):
+    """
+    Sum the discounted payoff over the terminal nodes of the binomial tree.
+
+    The terminal spots and risk-neutral probabilities are both built in log space so
+    that large step counts do not underflow. Contract arguments are either scalars or
+    (contracts x 1) columns, which broadcast against the row of terminal nodes. With
+    smoothing the sum runs over the nodes one step before expiry instead.
+
+    """
+
+    (logu, logd, pu) = _binomial_moves(option, spot, expiry, rate, volatility, dividend, steps, lattice)
+    dt = expiry / steps
+    levels = steps - 1 if smoothing else steps
+    nodes = np.arange(levels + 1)
+    disc = np.exp(-rate * dt * levels)
+
+    spotT = spot * np.exp((levels - nodes) * logu + nodes * logd)
+    logc = _log_binomial_coefficients(levels)
+    probT = np.exp(logc + (levels - nodes) * np.log(pu) + nodes * np.log1p(-pu))
+    payoffT = disc * _terminal_values(option, spotT, dt, rate, volatility, dividend, smoothing) * probT
+
+    return payoffT.sum(axis=-1)
+
+
+@functools.lru_cache(maxsize=64)
+def _log_binomial_coefficients(levels):
+    """
+    The logs of the binomial coefficients (levels choose k) for k = 0 to levels.
+
+    """
+
+    logf = np.array([math.lgamma(k + 1.0) for k in range(levels + 1)])
+    logc = logf[-1] - logf - logf[::-1]
+    logc.flags.writeable = False
+    return logc
+
+
+def AmericanBinomialPricer(pricing_engine, option, data):
+    """
+    The binomial option pricing model for a plain vanilla American option.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    """
+
+    (spot, rate, volatility, dividend) = data.get_data()
+    exercise = lambda steps: np.ones(steps, dtype=bool)
+
+    return _early_exercise_lattice(pricing_engine, option, spot, rate, volatility, dividend, exercise)
+
+
+def BermudanBinomialPricer(pricing_engine, option, data):
+    """
+    The binomial option pricing model for a Bermudan option.
+
+    Early exercise is checked only at the tree levels nearest to the option's exercise dates.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (BermudanPayoff):        an option payoff with an exercise_dates schedule
+        data (MarketData):              a market data variable via the MarketData interface
+
+    """
+
+    (spot, rate, volatility, dividend) = data.get_data()
+
+    def exercise(steps):
+        levels = np.rint(np.asarray(option.exercise_dates, dtype=float) * steps / option.expiry).astype(int)
+        flags = np.zeros(steps, dtype=bool)
+        flags[levels[(levels > 0) & (levels < steps)]] = True
+        return flags
+
+    return _early_exercise_lattice(pricing_engine, option, spot, rate, volatility, dividend, exercise)
+
+
+def _early_exercise_lattice(pricing_engine, option, spot, rate, volatility, dividend, exercise):
+    """
+    Price an option with early exercise on the engine's lattice, with its smoothing and
+    extrapolation. exercise(steps) gives the exercise flags for a lattice of that many steps.
+    Early exercise makes every lattice converge at first order, so the extrapolation does too.
+
+    """
+
+    _reject_path_payoff(option, "lattices")
+    lattice = pricing_engine.lattice
+    smoothing = _smoothing(pricing_engine)
+    if lattice == 'trinomial':
+        induction = _trinomial_backward_induction
+    else:
+        induction = functools.partial(_binomial_backward_induction, lattice=lattice)
+
+    price = lambda steps: induction(option, spot, rate, volatility, dividend, steps, exercise(steps),
+                                    smoothing=smoothing)
+
+    return _richardson(pricing_engine, price, 1)
+
+
+def _binomial_backward_induction(option, spot, rate, volatility, dividend, steps, exercise, lattice='crr',
+                                 smoothing=False):
+    """
+    Roll the option value back through the binomial tree, checking early exercise on the way.
+
+    Only the current level of the tree is ever held: the node values live in a single array
+    that is overwritten in place at each level, so memory is O(steps). The flags in exercise
+    mark the levels (0 to steps - 1) at which early exercise is allowed.
+
+    """
+
+    dt = option.expiry / steps
+    (logu, logd, pu) = _binomial_moves(option, spot, option.expiry, rate, volatility, dividend, steps, lattice)
+    u = np.exp(logu)
+    disc = np.exp(-rate * dt)
+    discu = disc * pu
+    discd = disc * (1 - pu)
+
+    top = steps - 1 if smoothing else steps
+    ratio = np.exp(np.arange(steps + 1) * (logd - logu))
+    values = np.array(_terminal_values(option, spot * u ** top * ratio[:top + 1], dt, rate, volatility, dividend,
+                                       smoothing), dtype=float)
+    if smoothing and exercise[top]:
+        np.maximum(values, option.payoff(spot * u ** top * ratio[:top + 1]), out=values)
+    scratch = np.empty(steps + 1)
+    spots = np.empty(steps + 1)
+
+    for i in range(top - 1, -1, -1):
+        level = values[:i + 1]
+        np.multiply(values[1:i + 2], discd, out=scratch[:i + 1])
+        level *= discu
+        level += scratch[:i + 1]
+        if exercise[i]:
+            np.multiply(ratio[:i + 1], spot * u ** i, out=spots[:i + 1])
+            np.maximum(level, option.payoff(spots[:i + 1]), out=level)
+
+    return values[0]
+
+
+def _trinomial_backward_induction(option, spot, rate, volatility, dividend, steps, exercise, smoothing=False):
+    """
+    Roll the option value back through a trinomial lattice, checking early exercise on the way.
+
+    The lattice is uniform in log spot with spacing volatility * sqrt(3 dt); node j of level i
+    sits i - j spacings above the spot. Contract arguments are either scalars or (contracts x 1)
+    columns, as in _european_binomial, and the flags in exercise are as in
+    _binomial_backward_induction.
+
+    """
+
+    dt = option.expiry / steps
+    dx = volatility * np.sqrt(3.0 * dt)
+    nu = (rate - dividend - 0.5 * volatility * volatility) * dt
+    a = (volatility * volatility * dt + nu * nu) / (dx * dx)
+    pu = 0.5 * (a + nu / dx)
+    pd = 0.5 * (a - nu / dx)
+    pm = 1.0 - a
+    disc = np.exp(-rate * dt)
+
+    top = steps - 1 if smoothing else steps
+    offsets = np.arange(2 * steps + 1)
+    level_spots = lambda i: spot * np.exp((i - offsets[:2 * i + 1]) * dx)
+    values = _terminal_values(option, level_spots(top), dt, rate, volatility, dividend, smoothing)
+    if smoothing and exercise[top]:
+        values = np.maximum(values, option.payoff(level_spots(top)))
+
+    for i in range(top - 1, -1, -1):
+        values = disc * (pu * values[..., :2 * i + 1] + pm * values[..., 1:2 * i + 2] + pd * values[..., 2:2 * i + 3])
+        if exercise[i]:
+            values = np.maximum(values, option.payoff(level_spots(i)))
+
+    return values[..., 0]
+
+
+MonteCarloGreeks = collections.namedtuple('MonteCarloGreeks', ['price', 'stderr', 'delta', 'gamma', 'vega'])
+
+MonteCarloResult = collections.namedtuple('MonteCarloResult', ['price', 'stderr', 'lower', 'upper', 'paths'])
+
+VarianceReducedResult = collections.namedtuple('VarianceReducedResult', ['price', 'stderr', 'factor'])
+
+_VARIANCE_REDUCTION_MODES = frozenset(['antithetic', 'moment_matching', 'control_variate'])
+
+_MOMENT_MATCHING_BATCHES = 20
+
+_BUMP = 0.01
+
+_Z95 = 1.959963984540054  # the 97.5% normal quantile
+
+_PENALTY = 1e8
+
+_PENALTY_ITERATIONS = 20
+
+
 class ControlVariateEngine(PricingEngine):
-    def __init__(self, replications, time_steps, alpha, Vbar, xi, pricer):
+    """
+    A concrete PricingEngine class for Monte Carlo simulation under Heston stochastic variance.
+
+    Replications are simulated in chunks of chunk_size paths, each drawn from its own random
+    stream spawned from seed, and the chunks may be spread over a pool of worker processes.
+    A given seed gives bit-identical prices whatever the number of workers.
+
+    ControlVariateMonteCarloPricer simulates in dtype, in the workspace buffers, with the
+    float32 accuracy described under MonteCarloPricingEngine; the greeks pricer uses float64.
+
+    Args:
+        replications (int): the number of simulated paths
+        time_steps (int):   the number of time steps per path
+        alpha (float):      the variance mean-reversion speed
+        Vbar (float):       the long-run variance
+        xi (float):         the volatility of variance
+        pricer (function):  a Heston pricer (i.e. ControlVariateMonteCarloPricer)
+        chunk_size (int):   the number of paths per chunk (and random stream); the default keeps
+                            a chunk's (paths x time_steps) arrays to a few megabytes, so that
+                            they are reused from one chunk to the next rather than reallocated
+        seed (int):         the root seed; None draws fresh entropy
+        workers (int):      the number of worker processes
+        dtype (dtype):      the floating point type of the simulated paths (float32 or float64)
+        workspace (Workspace): buffers to reuse from one call to the next; None reuses them within a call
+        executor (Executor): where chunks run when workers is above one; None creates a process pool of
+                            workers on first use and keeps it for later calls
+
+    """
+
+    def __init__(self, replications, time_steps, alpha, Vbar, xi, pricer, chunk_size=8192, seed=None, workers=1,
+                 dtype=np.float64, workspace=None, executor=None):
         self.__replications = replications
         self.__time_steps = time_steps
         self.__pricer = pricer
         self.__alpha = alpha
         self.__Vbar = Vbar
         self.__xi = xi
+        self.__chunk_size = chunk_size
+        self.__seed = seed
+        self.__workers = workers
+        self.__dtype = dtype
+        self.__workspace = workspace
+        self.__executor = executor
+        self.__pool = None
         
     @property
     def replications(self):
@@ -98,6 +619,7 @@ class ControlVariateEngine(PricingEngine):
     @replications.setter
     def replications(self, new_replications):
         self.__replications = new_replications
+        self._version += 1
         
     @property
     def time_steps(self):
@@ -106,6 +628,7 @@ class ControlVariateEngine(PricingEngine):
     @time_steps.setter
     def time_steps(self, new_time_steps):
         self.__time_steps = new_time_steps
+        self._version += 1
     
     @property
     def alpha(self):
@@ -114,6 +637,7 @@ class ControlVariateEngine(PricingEngine):
     @alpha.setter
     def alpha(self, new_alpha):
         self.__alpha = new_alpha
+        self._version += 1
     
     @property
     def Vbar(self):
@@ -122,6 +646,7 @@ class ControlVariateEngine(PricingEngine):
     @Vbar.setter
     def Vbar(self, new_Vbar):
         self.__Vbar = new_Vbar
+        self._version += 1
         
     @property
     def xi(self):
@@ -130,142 +655,1788 @@ class ControlVariateEngine(PricingEngine):
     @xi.setter
     def xi(self, new_xi):
         self.__xi = new_xi
-    
-    def calculate(self, option, data):
-        return self.__pricer(self, option, data)
+        self._version += 1
 
+    @property
+    def chunk_size(self):
+        return self.__chunk_size
 
-class MonteCarloPricingEngine(PricingEngine):
-    """
-    Doc string
-    """
+    @chunk_size.setter
+    def chunk_size(self, new_chunk_size):
+        self.__chunk_size = new_chunk_size
+        self._version += 1
 
-    def __init__(self, reps, steps, pricer):
-        self.__reps = reps
-        self.__steps = steps
-        self.__pricer = pricer
+    @property
+    def seed(self):
+        return self.__seed
+
+    @seed.setter
+    def seed(self, new_seed):
+        self.__seed = new_seed
+        self._version += 1
 
     @property
-    def reps(self):
-        return self.__reps
+    def workers(self):
+        return self.__workers
 
-    @reps.setter
-    def reps(self, new_reps):
-        self.__reps = new_reps
+    @workers.setter
+    def workers(self, new_workers):
+        self.__workers = new_workers
+        self._version += 1
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=False)
+            self.__pool = None
 
     @property
-    def steps(self):
-        return self.__steps
+    def dtype(self):
+        return self.__dtype
 
-    @steps.setter
-    def steps(self, new_steps):
-        self.__steps = new_steps
+    @dtype.setter
+    def dtype(self, new_dtype):
+        self.__dtype = new_dtype
+        self._version += 1
 
-    def calculate(self, option, data):
-        return self.__pricer(self, option, data)
+    @property
+    def workspace(self):
+        return self.__workspace
 
+    @property
+    def executor(self):
+        """
+        The executor given, else the engine's own process pool of workers, created on first use.
 
-def NaiveMonteCarloPricer(pricing_engine, option, data):
-    """
-    Doc string
-    """
+        """
 
-    expiry = option.expiry
-    strike = option.strike
+        if self.__executor is not None:
+            return self.__executor
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(max_workers=self.__workers)
+        return self.__pool
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_ControlVariateEngine__pool'] = None
+        return state
+
+    @property
+    def cacheable(self):
+        return self.__seed is not None
+
+    @property
+    def pricer(self):
+        return self.__pricer
+
+    def work(self, option, data, result):
+        return ('paths', self.__replications)
+
+    def calculate(self, option, data):
+        return self.__pricer(self, option, data)
+
+
+class MonteCarloPricingEngine(PricingEngine):
+    """
+    A concrete PricingEngine class that implements Monte Carlo simulation.
+
+    Paths are simulated and reduced in chunks, so peak memory depends on chunk_size
+    rather than on the total number of replications. Each chunk draws from its own random
+    stream spawned from seed, and the chunks may be spread over a pool of worker processes.
+    A given seed gives bit-identical prices whatever the number of workers.
+
+    VarianceReducedMonteCarloPricer applies the variance_reduction modes: any combination of
+    'antithetic', 'moment_matching' and 'control_variate'.
+
+    The adaptive pricer (AdaptiveMonteCarloPricer) treats reps as a path budget and stops
+    early once the standard error reaches target_stderr (absolute) or target_relative
+    (a fraction of the price), or once max_seconds of wall-clock time have passed.
+
+    NaiveMonteCarloPricer and AdaptiveMonteCarloPricer simulate in dtype and fill the
+    workspace buffers in place (see Workspace); the other pricers simulate in float64.
+    float32 halves the memory traffic. Its rounding error in the cumulative log return grows
+    with the number of steps: path points stay within about 1e-6 (relative) of float64 at 252
+    steps, and prices within about 1e-7, far below the standard error of any practical path
+    count. The payoff moments are always summed in float64. float32 draws differ from float64
+    draws, so a seed gives different (equally valid) prices in each dtype.
+
+    Args:
+        reps (int):              the number of simulated paths
+        steps (int):             the number of time steps per path
+        pricer (function):       a Monte Carlo pricer (i.e. NaiveMonteCarloPricer)
+        chunk_size (int):        the maximum number of paths held in memory at once (per worker)
+        seed (int):              the root seed; None draws fresh entropy
+        workers (int):           the number of worker processes
+        target_stderr (float):   the absolute standard error at which adaptive pricing stops
+        target_relative (float): the relative standard error at which adaptive pricing stops
+        max_seconds (float):     the wall-clock budget for adaptive pricing
+        variance_reduction (tuple): the variance reduction modes to apply (VarianceReducedMonteCarloPricer
+                                 only; other pricers raise ValueError if any are given)
+        dtype (dtype):           the floating point type of the simulated paths (float32 or float64)
+        workspace (Workspace):   buffers to reuse from one call to the next; None reuses them within a call
+        executor (Executor):     where chunks run when workers is above one; None creates a process pool of
+                                 workers on first use and keeps it for later calls
+
+    """
+
+    def __init__(self, reps, steps, pricer, chunk_size=100000, seed=None, workers=1,
+                 target_stderr=None, target_relative=None, max_seconds=None, variance_reduction=(),
+                 dtype=np.float64, workspace=None, executor=None):
+        self.__reps = reps
+        self.__steps = steps
+        self.__pricer = pricer
+        self.__chunk_size = chunk_size
+        self.__seed = seed
+        self.__workers = workers
+        self.__target_stderr = target_stderr
+        self.__target_relative = target_relative
+        self.__max_seconds = max_seconds
+        self.__variance_reduction = variance_reduction
+        self.__dtype = dtype
+        self.__workspace = workspace
+        self.__executor = executor
+        self.__pool = None
+
+    @property
+    def reps(self):
+        return self.__reps
+
+    @reps.setter
+    def reps(self, new_reps):
+        self.__reps = new_reps
+        self._version += 1
+
+    @property
+    def steps(self):
+        return self.__steps
+
+    @steps.setter
+    def steps(self, new_steps):
+        self.__steps = new_steps
+        self._version += 1
+
+    @property
+    def chunk_size(self):
+        return self.__chunk_size
+
+    @chunk_size.setter
+    def chunk_size(self, new_chunk_size):
+        self.__chunk_size = new_chunk_size
+        self._version += 1
+
+    @property
+    def seed(self):
+        return self.__seed
+
+    @seed.setter
+    def seed(self, new_seed):
+        self.__seed = new_seed
+        self._version += 1
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @workers.setter
+    def workers(self, new_workers):
+        self.__workers = new_workers
+        self._version += 1
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=False)
+            self.__pool = None
+
+    @property
+    def target_stderr(self):
+        return self.__target_stderr
+
+    @target_stderr.setter
+    def target_stderr(self, new_target_stderr):
+        self.__target_stderr = new_target_stderr
+        self._version += 1
+
+    @property
+    def target_relative(self):
+        return self.__target_relative
+
+    @target_relative.setter
+    def target_relative(self, new_target_relative):
+        self.__target_relative = new_target_relative
+        self._version += 1
+
+    @property
+    def max_seconds(self):
+        return self.__max_seconds
+
+    @max_seconds.setter
+    def max_seconds(self, new_max_seconds):
+        self.__max_seconds = new_max_seconds
+        self._version += 1
+
+    @property
+    def variance_reduction(self):
+        return self.__variance_reduction
+
+    @variance_reduction.setter
+    def variance_reduction(self, new_variance_reduction):
+        self.__variance_reduction = new_variance_reduction
+        self._version += 1
+
+    @property
+    def dtype(self):
+        return self.__dtype
+
+    @dtype.setter
+    def dtype(self, new_dtype):
+        self.__dtype = new_dtype
+        self._version += 1
+
+    @property
+    def workspace(self):
+        return self.__workspace
+
+    @property
+    def executor(self):
+        """
+        The executor given, else the engine's own process pool of workers, created on first use.
+
+        """
+
+        if self.__executor is not None:
+            return self.__executor
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(max_workers=self.__workers)
+        return self.__pool
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_MonteCarloPricingEngine__pool'] = None
+        return state
+
+    @property
+    def cacheable(self):
+        return self.__seed is not None
+
+    @property
+    def pricer(self):
+        return self.__pricer
+
+    def work(self, option, data, result):
+        return ('paths', result.paths if isinstance(result, MonteCarloResult) else self.__reps)
+
+    def calculate(self, option, data):
+        if self.__variance_reduction and self.__pricer is not VarianceReducedMonteCarloPricer:
+            raise ValueError("variance_reduction is applied by VarianceReducedMonteCarloPricer, not {0}".format(
+                getattr(self.__pricer, '__name__', self.__pricer)))
+        return self.__pricer(self, option, data)
+
+
+def NaiveMonteCarloPricer(pricing_engine, option, data):
+    """
+    Monte Carlo pricing under geometric Brownian motion.
+
+    Multi-step paths are simulated in chunks of pricing_engine.chunk_size; only each chunk's
+    payoff sum and sum of squares are kept, and these are added up in chunk order.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a tuple containing the option price and its standard error.
+
+    """
+
+    expiry = option.expiry
+    (spot, rate, volatility, dividend) = data.get_data()
+    reps = int(pricing_engine.reps)
+    steps = int(pricing_engine.steps)
+    disc = np.exp(-rate * expiry)
+
+    (total, total_sq) = _run_chunks(pricing_engine, reps, _naive_chunk_moments, option, spot, rate, volatility,
+                                    dividend, steps, np.dtype(pricing_engine.dtype), _workspace(pricing_engine))
+
+    return _moment_estimate(reps, total, total_sq, disc)
+
+
+def AdaptiveMonteCarloPricer(pricing_engine, option, data):
+    """
+    Monte Carlo pricing under geometric Brownian motion that stops once a target standard error is met.
+
+    Chunks of pricing_engine.chunk_size paths are simulated one after another, each from the
+    next random stream spawned from the seed (so the first chunks match NaiveMonteCarloPricer),
+    while running sums of the payoffs and their squares are kept. Simulation stops when the
+    standard error reaches the engine's absolute or relative target, when reps paths have been
+    used, or when max_seconds have passed.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a MonteCarloResult tuple of (price, stderr, lower, upper, paths), where lower and
+    upper bound the 95% confidence interval.
+
+    """
+
+    start = time.perf_counter()
+    expiry = option.expiry
+    (spot, rate, volatility, dividend) = data.get_data()
+    budget = int(pricing_engine.reps)
+    steps = int(pricing_engine.steps)
+    chunk_size = int(pricing_engine.chunk_size)
+    target_stderr = pricing_engine.target_stderr
+    target_relative = pricing_engine.target_relative
+    max_seconds = pricing_engine.max_seconds
+    disc = np.exp(-rate * expiry)
+    seeds = np.random.SeedSequence(pricing_engine.seed)
+    dtype = np.dtype(pricing_engine.dtype)
+    workspace = _workspace(pricing_engine)
+
+    paths = 0
+    total = 0.0
+    total_sq = 0.0
+    while paths < budget:
+        size = min(chunk_size, budget - paths)
+        (chunk_total, chunk_total_sq) = _naive_chunk_moments(option, spot, rate, volatility, dividend, steps,
+                                                             dtype, workspace, size, seeds.spawn(1)[0])
+        paths += size
+        total += chunk_total
+        total_sq += chunk_total_sq
+        if paths < 2:
+            continue
+        (price, stderr) = _moment_estimate(paths, total, total_sq, disc)
+        if ((target_stderr is not None and stderr <= target_stderr) or
+                (target_relative is not None and stderr <= target_relative * abs(price)) or
+                (max_seconds is not None and time.perf_counter() - start >= max_seconds)):
+            break
+
+    (price, stderr) = _moment_estimate(paths, total, total_sq, disc)
+    return MonteCarloResult(price, stderr, price - _Z95 * stderr, price + _Z95 * stderr, paths)
+
+
+def VarianceReducedMonteCarloPricer(pricing_engine, option, data):
+    """
+    Monte Carlo pricing under geometric Brownian motion with switchable variance reduction.
+
+    The modes in pricing_engine.variance_reduction may be combined:
+
+        antithetic:      every normal draw is paired with its negation and the pair's payoffs averaged
+        moment_matching: each chunk is split into _MOMENT_MATCHING_BATCHES independent batches, whose
+                         normals are shifted and scaled to zero mean and unit variance per time step
+        control_variate: a European call on the terminal spot at the option's strike, whose
+                         Black-Scholes price is known, with its weight estimated by regression
+
+    The variance reduction factor is the plain Monte Carlo variance (estimated from the same
+    paths) over the reduced estimator's variance, per path simulated. Moment matching ties the
+    paths of a batch together, so their within-sample variance says nothing about the error;
+    with it, the standard error (and so the factor) comes from the spread of the batch means.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a VarianceReducedResult tuple of (price, stderr, factor).
+
+    """
+
+    modes = frozenset(pricing_engine.variance_reduction)
+    unknown = modes - _VARIANCE_REDUCTION_MODES
+    if unknown:
+        raise ValueError("unknown variance reduction modes: {0}".format(", ".join(sorted(unknown))))
+
+    expiry = option.expiry
+    (spot, rate, volatility, dividend) = data.get_data()
+    reps = int(pricing_engine.reps)
+    steps = int(pricing_engine.steps)
+    disc = np.exp(-rate * expiry)
+
+    (n, total, total_sq, xtotal, xtotal_sq, xytotal, paths, raw, raw_sq, batches, btotal_sq, bxtotal_sq,
+     bxytotal) = _run_chunks(pricing_engine, reps, _variance_reduced_chunk_moments, option, spot, rate, volatility,
+                             dividend, steps, modes)
+
+    mean = total / n
+    xmean = xtotal / n
+    variance = (total_sq - n * mean * mean) / (n - 1)
+    beta = 0.0
+    if 'control_variate' in modes:
+        control = VanillaPayoff(expiry, option.strike, call_payoff)
+        xexpected = BlackScholesPricer(None, control, data) / disc
+        xvariance = (xtotal_sq - n * xmean * xmean) / (n - 1)
+        covariance = (xytotal - n * xmean * mean) / (n - 1)
+        beta = covariance / xvariance if xvariance > 0.0 else 0.0
+        variance = variance - beta * covariance
+
+    if batches > 1:
+        ##### Batch Means: n_k-weighted spread of the (control-adjusted) batch means #####
+        syy = btotal_sq - n * mean * mean
+        sxx = bxtotal_sq - n * xmean * xmean
+        sxy = bxytotal - n * xmean * mean
+        variance = (syy - 2.0 * beta * sxy + beta * beta * sxx) / (batches - 1)
+
+    if 'control_variate' in modes:
+        mean = mean - beta * (xmean - xexpected)
+    stderr = np.sqrt(max(variance, 0.0) / n)
+    raw_mean = raw / paths
+    plain_stderr_sq = (raw_sq - paths * raw_mean * raw_mean) / (paths - 1) / paths
+    factor = plain_stderr_sq / (stderr * stderr) if stderr > 0.0 else np.inf
+
+    return VarianceReducedResult(disc * mean, disc * stderr, factor)
+
+
+def _variance_reduced_chunk_moments(option, spot, rate, volatility, dividend, steps, modes, size, seed):
+    """
+    The moments over one chunk of variance-reduced paths.
+
+    Returns [units, sum y, sum y^2, sum x, sum x^2, sum xy, paths, sum payoff, sum payoff^2,
+    batches, sum Y^2 / m, sum X^2 / m, sum XY / m], where a unit is a path (or an antithetic
+    pair), y its payoff and x its control, and Y and X are the sums of y and x over each
+    moment-matched batch of m units (the batch terms are zero without moment matching).
+
+    """
+
+    expiry = option.expiry
+    rng = np.random.default_rng(seed)
+    units = (size + 1) // 2 if 'antithetic' in modes else size
+    z = rng.standard_normal(size=(units, steps))
+    if 'antithetic' in modes:
+        z = np.concatenate((z, -z))
+    # a chunk too small to split (a trailing path or pair) is one batch, left unmatched
+    batches = max(1, min(_MOMENT_MATCHING_BATCHES, units // 2)) if 'moment_matching' in modes else 0
+    bounds = np.linspace(0, units, batches + 1).astype(int)
+    for (lo, hi) in zip(bounds[:-1], bounds[1:]):
+        if hi - lo < 2:
+            continue
+        rows = np.r_[lo:hi, units + lo:units + hi] if 'antithetic' in modes else slice(lo, hi)
+        block = z[rows]
+        z[rows] = (block - block.mean(axis=0)) / block.std(axis=0)
+
+    paths = _gbm_paths(spot, expiry, rate, volatility, dividend, z)
+    payoff = _path_payoff(option, paths)
+    control = np.maximum(paths[:, -1] - option.strike, 0.0)
+    (y, x) = (payoff, control)
+    if 'antithetic' in modes:
+        y = 0.5 * (payoff[:units] + payoff[units:])
+        x = 0.5 * (control[:units] + control[units:])
+
+    batch = np.zeros(3)
+    if batches > 0:
+        (yb, xb, m) = (np.add.reduceat(y, bounds[:-1]), np.add.reduceat(x, bounds[:-1]), np.diff(bounds))
+        batch = np.array([yb @ (yb / m), xb @ (xb / m), xb @ (yb / m)])
+
+    return np.concatenate(([units, y.sum(), np.dot(y, y), x.sum(), np.dot(x, x), np.dot(x, y),
+                            payoff.size, payoff.sum(), np.dot(payoff, payoff), batches], batch))
+
+
+def _naive_chunk_moments(option, spot, rate, volatility, dividend, steps, dtype, workspace, size, seed):
+    """
+    The payoff sum and sum of squares over one chunk of geometric Brownian motion paths.
+
+    The normals and paths are built in the workspace buffers, in dtype.
+
+    """
+
+    z = workspace.array('normals', (size, steps), dtype)
+    np.random.default_rng(seed).standard_normal(dtype=dtype, out=z)
+    paths = _gbm_paths(spot, option.expiry, rate, volatility, dividend, z, workspace)
+    return _payoff_moments(_path_payoff(option, paths))
+
+
+def _payoff_moments(payoffT):
+    """
+    The payoff sum and sum of squares, accumulated in float64 whatever the precision of the paths.
+
+    """
+
+    payoffT = payoffT.astype(np.float64, copy=False)
+    return np.array([payoffT.sum(), np.dot(payoffT, payoffT)])
+
+
+def NaiveMonteCarloGreeksPricer(pricing_engine, option, data):
+    """
+    Monte Carlo pricing under geometric Brownian motion, with delta, gamma and vega from the same paths.
+
+    For vanilla calls and puts, delta and vega are pathwise estimators and gamma is the
+    likelihood-ratio derivative of the pathwise delta. Other payoffs are bumped and repriced
+    with common random numbers: the paths are rescaled (spot) or rebuilt (volatility) from the
+    same normal draws, so no extra simulation is needed.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a MonteCarloGreeks tuple of (price, stderr, delta, gamma, vega).
+
+    """
+
+    expiry = option.expiry
     (spot, rate, volatility, dividend) = data.get_data()
-    reps = pricing_engine.reps
-    steps = pricing_engine.steps
+    reps = int(pricing_engine.reps)
+    steps = int(pricing_engine.steps)
     disc = np.exp(-rate * expiry)
+
+    sums = _run_chunks(pricing_engine, reps, _naive_chunk_greeks, option, spot, rate, volatility, dividend, steps)
+    (price, stderr) = _moment_estimate(reps, sums[0], sums[1], disc)
+
+    return MonteCarloGreeks(price, stderr, *(disc * sums[2:] / reps))
+
+
+def _naive_chunk_greeks(option, spot, rate, volatility, dividend, steps, size, seed):
+    """
+    The payoff sum and sum of squares, and the delta, gamma and vega estimator sums, over one chunk.
+
+    """
+
+    expiry = option.expiry
     dt = expiry / steps
+    z = np.random.default_rng(seed).standard_normal(size=(size, steps))
+    paths = _gbm_paths(spot, expiry, rate, volatility, dividend, z)
+    payoffT = _path_payoff(option, paths)
+
+    if getattr(option, 'payoff_function', None) not in _CALL_PUT_SIGNS:
+        ds = _BUMP * spot
+        up = _path_payoff(option, paths * (1.0 + _BUMP))
+        down = _path_payoff(option, paths * (1.0 - _BUMP))
+        delta = (up - down) / (2.0 * ds)
+        gamma = (up - 2.0 * payoffT + down) / (ds * ds)
+        vega = (_path_payoff(option, _gbm_paths(spot, expiry, rate, volatility + _BUMP, dividend, z)) -
+                _path_payoff(option, _gbm_paths(spot, expiry, rate, volatility - _BUMP, dividend, z))) / (2.0 * _BUMP)
+    else:
+        spotT = paths[:, -1]
+        w = _call_put_sign(option)
+        itm = w * (w * (spotT - option.strike) > 0.0)
+        delta = itm * spotT / spot
+        gamma = itm * spotT / (spot * spot) * (z[:, 0] / (volatility * np.sqrt(dt)) - 1.0)
+        vega = itm * spotT * (np.log(spotT / spot) - (rate - dividend + 0.5 * volatility * volatility) * expiry) / volatility
+
+    return np.array([payoffT.sum(), np.dot(payoffT, payoffT), delta.sum(), gamma.sum(), vega.sum()])
 
+
+def _gbm_paths(spot, expiry, rate, volatility, dividend, z, workspace=None):
+    """
+    Build a (paths x steps + 1) array of geometric Brownian motion price paths from a (paths x steps) array of normals.
+
+    The first column of each path is the spot price, and the paths have the dtype of z. Given a
+    workspace, the normals in z are overwritten and the paths are built in one of its buffers.
+
+    """
+
+    (size, steps) = z.shape
+    dt = expiry / steps
     nudt = (rate - dividend - 0.5 * volatility * volatility) * dt
     sigsdt = volatility * np.sqrt(dt)
-    z = np.random.normal(size=reps)
 
-    spotT = spot * np.exp(nudt + sigsdt * z)
-    callT = option.payoff(spotT)
+    if workspace is None:
+        (increments, logs) = (np.empty_like(z), np.empty((size, steps + 1), dtype=z.dtype))
+    else:
+        (increments, logs) = (z, workspace.array('paths', (size, steps + 1), z.dtype))
+    np.multiply(z, sigsdt, out=increments)
+    increments += nudt
+    logs[:, 0] = 0.0
+    np.cumsum(increments, axis=1, out=logs[:, 1:])
+    np.exp(logs, out=logs)
+    logs *= spot
+    return logs
 
-    return callT.mean() * disc
 
+class Workspace(object):
+    """
+    Preallocated arrays that the Monte Carlo pricers fill in place, from one chunk and one call to the next.
 
-def BlackScholesDelta(St, t, K, T, sig, r, div):
-    tau = T - t
-    d1 = (np.log(St/K) + (r - div + 0.5 * sig * sig) * tau) / (sig * np.sqrt(tau))
-    delta = np.exp(-div * tau) * norm.cdf(d1)
-    return delta
-    
-def BlackScholesGamma(St, t, K, T, sig, r, div):
-    tau = T - t
-    d1 = (np.log(St/K) + (r - div + 0.5 * sig * sig) * tau) / (sig * np.sqrt(tau))
-    gamma = np.exp(-div * tau ) * (norm.pdf(d1) / St * sig * np.sqrt(tau))
-    return gamma
-    
-def BlackScholesVega(St, t, K, T, sig, r, div):
-    tau = T - t
-    d2 = (np.log(St / K) + (r - div - sig * sig * 0.5) * tau)/( sig * np.sqrt(tau))
-    vega = K * np.exp(-r * tau) * norm.pdf(d2) * np.sqrt(tau)
-    return vega
-    
-def ControlVariateMonteCarloPricer(pricing_engine, option, data):
-    expiry = option.expiry
-    strike = option.strike
-    alpha = pricing_engine.alpha
-    xi = pricing_engine.xi
-    Vbar = pricing_engine.Vbar
-    (spot, rate, volatility, dividend) = data.get_data()
-    dt = expiry / pricing_engine.time_steps
-    #nudt = (rate - dividend - 0.5 * volatility * volatility) * dt
-    xisdt = xi * np.sqrt(dt)
-    erddt = np.exp((rate - dividend) * dt)
-    egam1 = np.exp(2*(rate-dividend)*dt)
-    egam2 = -2*erddt+1
-    eveg1 = np.exp(-alpha*dt)
-    eveg2 = Vbar - Vbar *eveg1
-    
-    beta1 = -1
-    beta2 = 1
-    beta3 = 1
-    
-    payoff = np.zeros((pricing_engine.replications, ))
-    price = 0.0
+    Each named buffer grows to the largest size asked of it and is handed out as a view, so
+    a steady stream of same-sized prices allocates no new path arrays. A workspace must not be
+    used by two threads at once; worker processes are sent an empty copy of it.
 
-    for j in range(pricing_engine.replications):
-        
-        cv1 = 0
-        cv2 = 0
-        cv3 = 0
-        
-        s = np.zeros(pricing_engine.time_steps)
-        v = np.zeros(pricing_engine.time_steps)
-        s[0] = spot
-        v[0] = Vbar
-        z1 = np.random.normal(size=int(pricing_engine.time_steps))
-        z2 = np.random.normal(size=int(pricing_engine.time_steps))
-        
-        for i in range(int(pricing_engine.time_steps)):
-            t = (i-1) * dt
-            delta = BlackScholesDelta(s[i], t, strike, expiry, volatility, rate, dividend)
-            gamma = BlackScholesGamma(s[i], t, strike, expiry, volatility, rate, dividend)
-            vega = BlackScholesVega(s[i], t, strike, expiry, volatility, rate, dividend)
-            
-            ##### Evolve Variance #####
-            v[i] = v[i-1] + alpha * dt + (Vbar - v[i-1]) + xisdt * z1[i]
-            if v[i] < 0.0: 
-                v[i] = 0.0
-        
-            #####Evolve Asset Price #####
-            s[i] = s[i-1] * np.exp((rate - 0.5 * v[i-1]) * dt + np.sqrt(v[i-1]) * np.sqrt(dt) * z2[i])
-            
-            ##### Accumulate Control Variates #####
-            cv1 = cv1 + delta * (s[i] - s[i-1] * erddt)
-            cv2 = cv2 + gamma * ((s[i] - s[i-1]) * (s[i] - s[i-1]) - s[i-1] * s[i-1] * (egam1 * np.exp(v[i-1]*dt) + egam2))
-            cv3 = cv3 + vega * ((v[i]- v[i-1])-(v[i] * v[i] * eveg1 + eveg2 - v[i-1]))
-
-        print(strike)
-        strike = option.strike
-        payoff[j] = option.payoff(strike, s)
-        #payoff[j] = option.payoff(strike, s) + beta1 * cv1 + beta2 * cv3 + beta3 * cv3
-
-    price = np.exp(-rate * expiry) * payoff.mean()
-    #stderr = payoff.std() / np.sqrt(engine.replications)
-    return price
\ No newline at end of file
+    """
+
+    def __init__(self):
+        self.__buffers = {}
+
+    @property
+    def nbytes(self):
+        """
+        The total size of the buffers held.
+
+        """
+
+        return sum(buffer.nbytes for buffer in self.__buffers.values())
+
+    def array(self, name, shape, dtype):
+        """
+        An uninitialized array of the given shape and dtype, backed by the named buffer.
+
+        """
+
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        buffer = self.__buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = self.__buffers[name] = np.empty(size, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    def clear(self):
+        self.__buffers.clear()
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__buffers = {}
+
+
+def _workspace(pricing_engine):
+    """
+    The engine's workspace, or a new one that lasts for a single call.
+
+    """
+
+    return pricing_engine.workspace if pricing_engine.workspace is not None else Workspace()
+
+
+def _run_chunks(pricing_engine, reps, chunk_moments, *args):
+    """
+    Split reps into chunks of pricing_engine.chunk_size and add up chunk_moments over them.
+
+    Every chunk gets its own SeedSequence spawned from pricing_engine.seed and is called as
+    chunk_moments(*args, size, seed). Chunks run on pricing_engine.executor when
+    pricing_engine.workers is above one. The partial moments are always summed in chunk order,
+    so a given seed gives bit-identical results for any number of workers.
+
+    """
+
+    chunk_size = int(pricing_engine.chunk_size)
+    sizes = [min(chunk_size, reps - start) for start in range(0, reps, chunk_size)]
+    seeds = np.random.SeedSequence(pricing_engine.seed).spawn(len(sizes))
+    task = functools.partial(chunk_moments, *args)
+    workers = min(int(pricing_engine.workers), len(sizes))
+
+    if workers > 1:
+        return functools.reduce(np.add, pricing_engine.executor.map(task, sizes, seeds))
+    return functools.reduce(np.add, map(task, sizes, seeds))
+
+
+def _path_payoff(option, paths):
+    """
+    Evaluate a payoff over a chunk of paths: exotic payoffs see the whole path, vanilla payoffs the terminal spot.
+
+    """
+
+    if isinstance(option, ExoticPayoff):
+        return option.payoff(paths)
+    return option.payoff(paths[:, -1])
+
+
+def _moment_estimate(reps, total, total_sq, disc):
+    """
+    The discounted price and standard error from the payoff sum and sum of squares.
+
+    """
+
+    mean = total / reps
+    variance = max(total_sq - reps * mean * mean, 0.0) / (reps - 1)
+    return (disc * mean, disc * np.sqrt(variance / reps))
+
+
+class QuasiMonteCarloPricingEngine(PricingEngine):
+    """
+    A concrete PricingEngine class that implements randomized quasi-Monte Carlo simulation.
+
+    Each of the replicates is an independently scrambled Sobol point set of reps points
+    (ideally a power of two); the spread of the replicate estimates gives the standard error.
+
+    Args:
+        reps (int):        the number of Sobol points per replicate
+        steps (int):       the number of time steps per path
+        pricer (function): a quasi-Monte Carlo pricer (i.e. SobolMonteCarloPricer)
+        replicates (int):  the number of independent scramblings
+        seed (int):        the root seed; None draws fresh entropy
+
+    """
+
+    def __init__(self, reps, steps, pricer, replicates=16, seed=None):
+        self.__reps = reps
+        self.__steps = steps
+        self.__pricer = pricer
+        self.__replicates = replicates
+        self.__seed = seed
+
+    @property
+    def reps(self):
+        return self.__reps
+
+    @reps.setter
+    def reps(self, new_reps):
+        self.__reps = new_reps
+        self._version += 1
+
+    @property
+    def steps(self):
+        return self.__steps
+
+    @steps.setter
+    def steps(self, new_steps):
+        self.__steps = new_steps
+        self._version += 1
+
+    @property
+    def replicates(self):
+        return self.__replicates
+
+    @replicates.setter
+    def replicates(self, new_replicates):
+        self.__replicates = new_replicates
+        self._version += 1
+
+    @property
+    def seed(self):
+        return self.__seed
+
+    @seed.setter
+    def seed(self, new_seed):
+        self.__seed = new_seed
+        self._version += 1
+
+    @property
+    def cacheable(self):
+        return self.__seed is not None
+
+    @property
+    def pricer(self):
+        return self.__pricer
+
+    def work(self, option, data, result):
+        return ('paths', self.__reps * self.__replicates)
+
+    def calculate(self, option, data):
+        return self.__pricer(self, option, data)
+
+
+def SobolMonteCarloPricer(pricing_engine, option, data):
+    """
+    Quasi-Monte Carlo pricing under geometric Brownian motion with scrambled Sobol points.
+
+    The Sobol points are mapped to normals and the paths are built with a Brownian bridge,
+    so the leading Sobol dimensions set the terminal value and the coarse shape of each path.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a tuple containing the option price and its standard error across replicates.
+
+    """
+
+    from scipy.special import ndtri  # imported here to keep dylan.engine quick to import
+    from scipy.stats import qmc
+
+    expiry = option.expiry
+    (spot, rate, volatility, dividend) = data.get_data()
+    reps = int(pricing_engine.reps)
+    steps = int(pricing_engine.steps)
+    replicates = int(pricing_engine.replicates)
+    disc = np.exp(-rate * expiry)
+    plan = _brownian_bridge_plan(steps)
+
+    estimates = np.empty(replicates)
+    for i, seed in enumerate(np.random.SeedSequence(pricing_engine.seed).spawn(replicates)):
+        sobol = qmc.Sobol(steps, scramble=True, seed=np.random.default_rng(seed))
+        z = _brownian_bridge(ndtri(sobol.random(reps)), plan)
+        paths = _gbm_paths(spot, expiry, rate, volatility, dividend, z)
+        estimates[i] = _path_payoff(option, paths).mean()
+
+    stderr = estimates.std(ddof=1) / np.sqrt(replicates) if replicates > 1 else np.nan
+    return (disc * estimates.mean(), disc * stderr)
+
+
+def _brownian_bridge_plan(steps):
+    """
+    The Brownian bridge construction order over steps equal time steps.
+
+    Returns a list of (point, left, right, left weight, right weight, stddev) in units of
+    the time step, with the terminal point first and the intervals then bisected breadth first.
+
+    """
+
+    plan = [(steps, 0, 0, 0.0, 0.0, np.sqrt(steps))]
+    intervals = collections.deque([(0, steps)])
+    while intervals:
+        (left, right) = intervals.popleft()
+        if right - left < 2:
+            continue
+        mid = (left + right) // 2
+        span = right - left
+        plan.append((mid, left, right, (right - mid) / span, (mid - left) / span,
+                     np.sqrt((mid - left) * (right - mid) / span)))
+        intervals.append((left, mid))
+        intervals.append((mid, right))
+    return plan
+
+
+def _brownian_bridge(z, plan):
+    """
+    Turn a (paths x steps) array of normals into Brownian bridge increments, scaled to unit variance per step.
+
+    Column k of z drives the k-th point of the construction plan.
+
+    """
+
+    (size, steps) = z.shape
+    w = np.zeros((size, steps + 1))
+    for (k, (point, left, right, wl, wr, sd)) in enumerate(plan):
+        w[:, point] = wl * w[:, left] + wr * w[:, right] + sd * z[:, k]
+    return np.diff(w, axis=1)
+
+
+BlackScholesGreeks = collections.namedtuple('BlackScholesGreeks', ['price', 'delta', 'gamma', 'vega', 'theta', 'rho'])
+
+
+class BlackScholesPricingEngine(PricingEngine):
+    """
+    A concrete PricingEngine class that implements the closed-form Black-Scholes model.
+
+    The pricers work on whole arrays, so a book of contracts can be priced in one call.
+
+    Args:
+        pricer (function): a Black-Scholes pricer (i.e. BlackScholesPricer or BlackScholesGreeksPricer)
+
+    """
+
+    def __init__(self, pricer):
+        self.__pricer = pricer
+
+    @property
+    def vectorized(self):
+        return True
+
+    @property
+    def pricer(self):
+        return self.__pricer
+
+    def work(self, option, data, result):
+        return ('contracts', _contracts(option, data))
+
+    def calculate(self, option, data):
+        return self.__pricer(self, option, data)
+
+    def calculate_batch(self, payoff, spot, strike, expiry, rate, volatility, dividend):
+        """
+        Price a book of European contracts in one vectorized pass (one calculate call).
+
+        Returns whatever the engine's pricer returns, with arrays in place of scalars.
+
+        """
+
+        (spot, strike, expiry, rate, volatility, dividend) = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (spot, strike, expiry, rate, volatility, dividend)))
+        return self.calculate(VanillaPayoff(expiry, strike, payoff), MarketData(rate, spot, volatility, dividend))
+
+
+def BlackScholesPricer(pricing_engine, option, data):
+    """
+    The Black-Scholes price of a plain vanilla European call or put.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    """
+
+    (spot, rate, volatility, dividend) = data.get_data()
+
+    return _black_scholes_price(option, spot, option.expiry, rate, volatility, dividend)
+
+
+def _black_scholes_price(option, spot, tau, rate, volatility, dividend):
+    """
+    The Black-Scholes value of a call or put with tau years left to expiry.
+
+    """
+
+    w = _call_put_sign(option)
+    (d1, d2) = _black_scholes_d1_d2(spot, option.strike, tau, volatility, rate, dividend)
+
+    return w * (spot * np.exp(-dividend * tau) * _ndtr(w * d1) - option.strike * np.exp(-rate * tau) * _ndtr(w * d2))
+
+
+def BlackScholesGreeksPricer(pricing_engine, option, data):
+    """
+    The Black-Scholes price and greeks of a plain vanilla European call or put.
+
+    d1 and d2 are computed once and shared by every output. Theta is the change in value
+    per year of calendar time; vega and rho are per unit change in volatility and rate.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a BlackScholesGreeks tuple of (price, delta, gamma, vega, theta, rho).
+
+    """
+
+    (spot, rate, volatility, dividend) = data.get_data()
+    strike = option.strike
+    tau = option.expiry
+    w = _call_put_sign(option)
+    (d1, d2) = _black_scholes_d1_d2(spot, strike, tau, volatility, rate, dividend)
+
+    sqrtt = np.sqrt(tau)
+    sfwd = spot * np.exp(-dividend * tau)
+    kdisc = strike * np.exp(-rate * tau)
+    nd1 = _ndtr(w * d1)
+    nd2 = _ndtr(w * d2)
+    pdf = np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi)
+
+    price = w * (sfwd * nd1 - kdisc * nd2)
+    delta = w * np.exp(-dividend * tau) * nd1
+    gamma = np.exp(-dividend * tau) * pdf / (spot * volatility * sqrtt)
+    vega = sfwd * pdf * sqrtt
+    theta = -sfwd * pdf * volatility / (2.0 * sqrtt) - w * rate * kdisc * nd2 + w * dividend * sfwd * nd1
+    rho = w * tau * kdisc * nd2
+
+    return BlackScholesGreeks(price, delta, gamma, vega, theta, rho)
+
+
+def _black_scholes_d1_d2(spot, strike, tau, volatility, rate, dividend):
+    """
+    The Black-Scholes d1 and d2 terms.
+
+    """
+
+    sigsdt = volatility * np.sqrt(tau)
+    d1 = (np.log(spot / strike) + (rate - dividend + 0.5 * volatility * volatility) * tau) / sigsdt
+    return (d1, d1 - sigsdt)
+
+
+_NDTR_SCIPY_SIZE = 1 << 16
+
+_SQRTH = 0.7071067811865476
+
+_ERF_T = (9.60497373987051638749E0, 9.00260197203842689217E1, 2.23200534594684319226E3,
+          7.00332514112805075473E3, 5.55923013010394962768E4)
+
+_ERF_U = (1.0, 3.35617141647503099647E1, 5.21357949780152679795E2, 4.59432382970980127987E3,
+          2.26290000613890934246E4, 4.92673942608635921086E4)
+
+_ERFC_P = (2.46196981473530512524E-10, 5.64189564831068821977E-1, 7.46321056442269912687E0,
+           4.86371970985681366614E1, 1.96520832956077098242E2, 5.26445194995477358631E2,
+           9.34528527171957607540E2, 1.02755188689515710272E3, 5.57535335369399327526E2)
+
+_ERFC_Q = (1.0, 1.32281951154744992508E1, 8.67072140885989742329E1, 3.54937778887819891062E2,
+           9.75708501743205489753E2, 1.82390916687909736289E3, 2.24633760818710981792E3,
+           1.65666309194161350182E3, 5.57535340817727675546E2)
+
+_ERFC_R = (5.64189583547755073984E-1, 1.27536670759978104416E0, 5.01905042251180477414E0,
+           6.16021097993053585195E0, 7.40974269950448939160E0, 2.97886665372100240670E0)
+
+_ERFC_S = (1.0, 2.26052863220117276590E0, 9.39603524938001434673E0, 1.20489539808096656605E1,
+           1.70814450747565897222E1, 9.60896809063285878198E0, 3.36907645100081516050E0)
+
+
+def _ndtr(x):
+    """
+    The standard normal distribution function.
+
+    Arrays of _NDTR_SCIPY_SIZE or more elements go to scipy.special.ndtr, whose import (about a
+    quarter of a second) is small next to their pricing. Smaller ones, such as a command-line
+    chunk or a single contract, use a numpy port of the same Cephes rational approximations
+    (erf near zero, erfc in the tails), which agrees with it to about 1e-15 and keeps
+    scipy.special out of start-up.
+
+    """
+
+    if np.size(x) >= _NDTR_SCIPY_SIZE:
+        from scipy.special import ndtr  # imported here to keep dylan.engine quick to import
+        return ndtr(x)
+
+    x = np.asarray(x, dtype=float)
+    a = np.ravel(x) * _SQRTH
+    z = np.minimum(np.abs(a), 40.0)
+    (y, scratch) = (np.empty(a.shape), np.empty(a.shape))
+
+    ##### Tails #####
+    _horner(z, _ERFC_P, y)
+    y /= _horner(z, _ERFC_Q, scratch)
+    far = z >= 8.0
+    if far.any():
+        zf = z[far]
+        y[far] = _horner(zf, _ERFC_R, np.empty(zf.shape)) / _horner(zf, _ERFC_S, np.empty(zf.shape))
+    np.multiply(z, z, out=scratch)
+    np.negative(scratch, out=scratch)
+    np.exp(scratch, out=scratch)
+    y *= scratch
+    y *= 0.5
+    np.subtract(1.0, y, out=y, where=a > 0)
+
+    ##### Centre #####
+    near = z < 1.0
+    if near.any():
+        an = a[near]
+        aa = an * an
+        y[near] = 0.5 + 0.5 * an * _horner(aa, _ERF_T, np.empty(an.shape)) / _horner(aa, _ERF_U, np.empty(an.shape))
+    y[np.isnan(a)] = np.nan
+
+    return y.reshape(x.shape)[()]
+
+
+def _horner(x, coefficients, out):
+    """
+    Evaluate the polynomial with the given coefficients (highest power first) at x, into out.
+
+    """
+
+    out.fill(coefficients[0])
+    for c in coefficients[1:]:
+        out *= x
+        out += c
+    return out
+
+
+def _call_put_sign(option):
+    """
+    +1 for a call and -1 for a put.
+
+    Raises ValueError for any other payoff (i.e. a digital), which the closed-form pricers
+    would otherwise price as a call.
+
+    """
+
+    function = getattr(option, 'payoff_function', None)
+    sign = _CALL_PUT_SIGNS.get(function)
+    if sign is None:
+        name = getattr(function, '__name__', type(option).__name__)
+        raise ValueError("only call_payoff and put_payoff vanilla options are supported, not {0}".format(name))
+    return sign
+
+
+_CALL_PUT_SIGNS = {call_payoff: 1.0, put_payoff: -1.0}
+
+
+def _contracts(option, data):
+    """
+    The number of contracts a vectorized calculate call prices.
+
+    """
+
+    return np.broadcast(option.strike, option.expiry, *data.get_data()).size
+
+
+def BlackScholesDelta(St, t, K, T, sig, r, div):
+    tau = T - t
+    d1 = (np.log(St/K) + (r - div + 0.5 * sig * sig) * tau) / (sig * np.sqrt(tau))
+    delta = np.exp(-div * tau) * _ndtr(d1)
+    return delta
+    
+def BlackScholesGamma(St, t, K, T, sig, r, div):
+    tau = T - t
+    d1 = (np.log(St/K) + (r - div + 0.5 * sig * sig) * tau) / (sig * np.sqrt(tau))
+    gamma = np.exp(-div * tau ) * (np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi) / (St * sig * np.sqrt(tau)))
+    return gamma
+    
+def BlackScholesVega(St, t, K, T, sig, r, div):
+    tau = T - t
+    d2 = (np.log(St / K) + (r - div - sig * sig * 0.5) * tau)/( sig * np.sqrt(tau))
+    vega = K * np.exp(-r * tau) * np.exp(-0.5 * d2 * d2) / np.sqrt(2.0 * np.pi) * np.sqrt(tau)
+    return vega
+    
+def _black_scholes_hedge_ratios(St, t, K, T, sig, r, div):
+    """
+    The Black-Scholes delta, gamma and vega over whole (paths x steps) arrays, sharing a single d1.
+
+    The arithmetic is done in place, so few full-size temporaries are made. The normal
+    distribution function in the delta is the Zelen-Severo approximation (Abramowitz and
+    Stegun 26.2.17, error below 7.5e-8), built from the density that gamma and vega need
+    anyway. A control variate keeps its zero mean whatever the hedge ratio, so this costs
+    nothing in accuracy.
+
+    """
+
+    tau = T - t
+    sigsdt = sig * np.sqrt(tau)
+    edivt = np.exp(-div * tau)
+    d1 = np.log(St / K)
+    d1 += (r - div + 0.5 * sig * sig) * tau
+    d1 /= sigsdt
+    above = d1 >= 0.0
+    x = np.abs(d1)
+    x *= 0.2316419
+    x += 1.0
+    t = np.reciprocal(x, out=x)
+    pdf = np.square(d1, out=d1)
+    pdf *= -0.5
+    np.exp(pdf, out=pdf)
+    pdf *= 1.0 / np.sqrt(2.0 * np.pi)
+
+    ##### Normal Tail Probability #####
+    delta = np.multiply(t, 1.330274429)
+    for b in (-1.821255978, 1.781477937, -0.356563782, 0.319381530):
+        delta += b
+        delta *= t
+    delta *= pdf
+    np.subtract(1.0, delta, out=delta, where=above)
+    delta *= edivt
+
+    pdf *= edivt
+    gamma = pdf / St
+    gamma /= sigsdt
+    vega = np.multiply(St, pdf, out=pdf)
+    vega *= np.sqrt(tau)
+    return (delta, gamma, vega)
+
+def ControlVariateMonteCarloPricer(pricing_engine, option, data):
+    """
+    Monte Carlo pricing under Heston stochastic variance with delta, gamma and vega control variates.
+
+    Replications are simulated in chunks of pricing_engine.chunk_size. Within a chunk every
+    path is simulated at once: the variance process is stepped forward one column at a time
+    over a (replications x time_steps) array; the asset paths, the Black-Scholes hedge ratios
+    and the control variates are then whole-array operations. The control variate weights
+    (betas) are the least squares regression of the payoffs on the control variates, solved
+    from cross-product moments that are added up exactly across chunks.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a tuple containing the option price and its standard error.
+
+    """
+
+    (spot, rate, volatility, dividend) = data.get_data()
+    reps = int(pricing_engine.replications)
+    steps = int(pricing_engine.time_steps)
+    disc = np.exp(-rate * option.expiry)
+
+    moments = _run_chunks(pricing_engine, reps, _heston_chunk_moments, option, spot, rate, volatility,
+                          dividend, pricing_engine.alpha, pricing_engine.Vbar, pricing_engine.xi, steps,
+                          np.dtype(pricing_engine.dtype), _workspace(pricing_engine))
+
+    return _control_variate_estimate(reps, moments, disc)
+
+
+def _control_variate_estimate(reps, moments, disc):
+    """
+    The discounted beta-weighted price and standard error from the [1, cv1, cv2, cv3, payoff] cross-product moments.
+
+    """
+
+    xx = moments[:4, :4]
+    xy = moments[:4, 4]
+    beta = np.linalg.lstsq(xx, xy, rcond=None)[0]
+    mean = beta[0]
+    total_sq = moments[4, 4] - 2.0 * beta[1:] @ xy[1:] + beta[1:] @ xx[1:, 1:] @ beta[1:]
+
+    return _moment_estimate(reps, reps * mean, total_sq, disc)
+
+
+def _heston_chunk_moments(option, spot, rate, volatility, dividend, alpha, Vbar, xi, steps, dtype, workspace,
+                          size, seed):
+    """
+    The cross-product moments of [1, cv1, cv2, cv3, payoff] over one chunk of Heston paths.
+
+    The normals and paths are built in the workspace buffers, in dtype; the moments are float64.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    z1 = rng.standard_normal(dtype=dtype, out=workspace.array('normals', (steps, size), dtype)).T
+    z2 = rng.standard_normal(dtype=dtype, out=workspace.array('normals2', (steps, size), dtype)).T
+    (s, v) = _heston_paths(spot, option.expiry, rate, dividend, alpha, Vbar, xi, Vbar, z1, z2, workspace)
+    cv = _heston_control_variates(option, s, v, z1, rate, volatility, dividend, xi)
+
+    w = np.column_stack((np.ones(size), cv, _path_payoff(option, s)))
+    return w.T @ w
+
+
+def ControlVariateMonteCarloGreeksPricer(pricing_engine, option, data):
+    """
+    Heston control variate Monte Carlo pricing, with delta, gamma and vega from the same random numbers.
+
+    The price and its standard error are those of ControlVariateMonteCarloPricer. Heston
+    paths scale linearly with the spot, so delta and gamma are central differences of the
+    payoffs on rescaled paths. Vega is the sensitivity to the initial volatility sqrt(v0),
+    with the variance and asset paths rebuilt from the same normal draws.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a MonteCarloGreeks tuple of (price, stderr, delta, gamma, vega).
+
+    """
+
+    (spot, rate, volatility, dividend) = data.get_data()
+    reps = int(pricing_engine.replications)
+    steps = int(pricing_engine.time_steps)
+    disc = np.exp(-rate * option.expiry)
+
+    sums = _run_chunks(pricing_engine, reps, _heston_chunk_greeks, option, spot, rate, volatility,
+                       dividend, pricing_engine.alpha, pricing_engine.Vbar, pricing_engine.xi, steps)
+    (price, stderr) = _control_variate_estimate(reps, sums[:25].reshape(5, 5), disc)
+
+    return MonteCarloGreeks(price, stderr, *(disc * sums[25:] / reps))
+
+
+def _heston_chunk_greeks(option, spot, rate, volatility, dividend, alpha, Vbar, xi, steps, size, seed):
+    """
+    The control variate cross-product moments (flattened), and the delta, gamma and vega sums, over one chunk.
+
+    """
+
+    expiry = option.expiry
+    rng = np.random.default_rng(seed)
+    z1 = rng.standard_normal(size=(steps, size)).T
+    z2 = rng.standard_normal(size=(steps, size)).T
+    (s, v) = _heston_paths(spot, expiry, rate, dividend, alpha, Vbar, xi, Vbar, z1, z2)
+    cv = _heston_control_variates(option, s, v, z1, rate, volatility, dividend, xi)
+    payoff = _path_payoff(option, s)
+    w = np.column_stack((np.ones(size), cv, payoff))
+
+    ds = _BUMP * spot
+    up = _path_payoff(option, s * (1.0 + _BUMP))
+    down = _path_payoff(option, s * (1.0 - _BUMP))
+    delta = (up - down) / (2.0 * ds)
+    gamma = (up - 2.0 * payoff + down) / (ds * ds)
+    vol0 = np.sqrt(Vbar)
+    vega = (_path_payoff(option, _heston_paths(spot, expiry, rate, dividend, alpha, Vbar, xi, (vol0 + _BUMP) ** 2, z1, z2)[0]) -
+            _path_payoff(option, _heston_paths(spot, expiry, rate, dividend, alpha, Vbar, xi, (vol0 - _BUMP) ** 2, z1, z2)[0])) / (2.0 * _BUMP)
+
+    return np.concatenate(((w.T @ w).ravel(), [delta.sum(), gamma.sum(), vega.sum()]))
+
+
+def _heston_paths(spot, expiry, rate, dividend, alpha, Vbar, xi, v0, z1, z2, workspace=None):
+    """
+    Build (paths x steps + 1) arrays of Heston asset prices and variances from two arrays of normals.
+
+    The paths have the dtype of the normals and, given a workspace, are built in its buffers.
+    Every step is computed in place, so no temporaries are allocated inside the time loop.
+    The buffers are time-major and the paths are returned as transposed views, so each step
+    of the loop works on contiguous memory; normals drawn as (steps x paths) and transposed
+    (as the pricers do) keep every whole-array operation on one layout.
+
+    """
+
+    (size, steps) = z1.shape
+    dtype = np.result_type(z1, z2)
+    dt = expiry / steps
+    xisdt = xi * np.sqrt(dt)
+    workspace = Workspace() if workspace is None else workspace
+
+    ##### Evolve Variance #####
+    v = workspace.array('variances', (steps + 1, size), dtype).T
+    diffusion = workspace.array('diffusion', (steps, size), dtype).T
+    v[:, 0] = v0
+    for i in range(steps):
+        (vi, vn, root) = (v[:, i], v[:, i + 1], diffusion[:, i])
+        np.sqrt(vi, out=root)
+        root *= xisdt
+        root *= z1[:, i]
+        np.subtract(Vbar, vi, out=vn)
+        vn *= alpha * dt
+        vn += vi
+        vn += root
+        np.maximum(vn, 0.0, out=vn)
+    v0 = v[:, :-1]
+
+    ##### Evolve Asset Price #####
+    s = workspace.array('spots', (steps + 1, size), dtype).T
+    increments = s[:, 1:]
+    np.multiply(v0, 0.5, out=increments)
+    np.subtract(rate - dividend, increments, out=increments)
+    increments *= dt
+    np.multiply(v0, dt, out=diffusion)
+    np.sqrt(diffusion, out=diffusion)
+    diffusion *= z2
+    increments += diffusion
+    np.cumsum(increments, axis=1, out=increments)
+    np.exp(increments, out=increments)
+    increments *= spot
+    s[:, 0] = spot
+    return (s, v)
+
+
+def _heston_control_variates(option, s, v, z1, rate, volatility, dividend, xi):
+    """
+    The delta, gamma and vega control variates of each Heston path, as a (paths x 3) array.
+
+    Each control sums hedge ratio times an increment with exactly zero conditional mean under
+    the simulated scheme. The vega control uses the variance diffusion xi * sqrt(v dt) * z1
+    rather than the variance change less its CIR mean, which the truncated Euler step does not
+    follow (that left the regression intercept, and so the price, biased).
+
+    """
+
+    expiry = option.expiry
+    steps = s.shape[1] - 1
+    dt = expiry / steps
+    erddt = np.exp((rate - dividend) * dt)
+    egam1 = np.exp(2 * (rate - dividend) * dt)
+    egam2 = -2 * erddt + 1
+    (s0, s1) = (s[:, :-1], s[:, 1:])
+    v0 = v[:, :-1]
+
+    ##### Accumulate Control Variates #####
+    t = np.arange(steps) * dt
+    (delta, gamma, vega) = _black_scholes_hedge_ratios(s0, t, option.strike, expiry, volatility, rate, dividend)
+    increment = np.multiply(s0, erddt)
+    np.subtract(s1, increment, out=increment)
+    cv1 = np.einsum('ij,ij->i', delta, increment)
+    np.subtract(s1, s0, out=increment)
+    np.square(increment, out=increment)
+    expected = np.multiply(v0, dt, out=delta)
+    np.exp(expected, out=expected)
+    expected *= egam1
+    expected += egam2
+    expected *= s0
+    expected *= s0
+    increment -= expected
+    cv2 = np.einsum('ij,ij->i', gamma, increment)
+    diffusion = np.sqrt(v0, out=increment)
+    diffusion *= z1
+    cv3 = np.einsum('ij,ij->i', vega, diffusion) * (xi * np.sqrt(dt))
+    return np.column_stack((cv1, cv2, cv3))
+
+
+class FourierPricingEngine(PricingEngine):
+    """
+    A concrete PricingEngine class that prices European options under Heston stochastic variance
+    from the model's characteristic function.
+
+    The variance follows the process simulated by ControlVariateEngine: it reverts at speed
+    alpha to the long-run variance Vbar with volatility of variance xi. It starts from the
+    square of the market data volatility, where ControlVariateEngine starts it at Vbar, so the
+    two agree when the volatility is sqrt(Vbar). rho is the correlation between the asset and
+    variance shocks; ControlVariateEngine uses zero. The pricers work on whole arrays. A strike ladder
+    costs one set of characteristic function evaluations per expiry, which makes calibration
+    to a full surface fast (see dylan.calibration).
+
+    Args:
+        alpha (float):      the variance mean-reversion speed
+        Vbar (float):       the long-run variance
+        xi (float):         the volatility of variance
+        pricer (function):  a Fourier pricer (i.e. HestonCOSPricer)
+        rho (float):        the correlation between the asset and variance shocks
+        terms (int):        the number of terms in the Fourier-cosine expansion
+        truncation (float): the half-width of the integration range, in standard deviations of the log return
+
+    """
+
+    def __init__(self, alpha, Vbar, xi, pricer, rho=0.0, terms=256, truncation=16.0):
+        self.__alpha = alpha
+        self.__Vbar = Vbar
+        self.__xi = xi
+        self.__pricer = pricer
+        self.__rho = rho
+        self.__terms = terms
+        self.__truncation = truncation
+
+    @property
+    def alpha(self):
+        return self.__alpha
+
+    @alpha.setter
+    def alpha(self, new_alpha):
+        self.__alpha = new_alpha
+        self._version += 1
+
+    @property
+    def Vbar(self):
+        return self.__Vbar
+
+    @Vbar.setter
+    def Vbar(self, new_Vbar):
+        self.__Vbar = new_Vbar
+        self._version += 1
+
+    @property
+    def xi(self):
+        return self.__xi
+
+    @xi.setter
+    def xi(self, new_xi):
+        self.__xi = new_xi
+        self._version += 1
+
+    @property
+    def rho(self):
+        return self.__rho
+
+    @rho.setter
+    def rho(self, new_rho):
+        self.__rho = new_rho
+        self._version += 1
+
+    @property
+    def terms(self):
+        return self.__terms
+
+    @terms.setter
+    def terms(self, new_terms):
+        self.__terms = new_terms
+        self._version += 1
+
+    @property
+    def truncation(self):
+        return self.__truncation
+
+    @truncation.setter
+    def truncation(self, new_truncation):
+        self.__truncation = new_truncation
+        self._version += 1
+
+    @property
+    def vectorized(self):
+        return True
+
+    @property
+    def pricer(self):
+        return self.__pricer
+
+    def work(self, option, data, result):
+        return ('contracts', _contracts(option, data))
+
+    def calculate(self, option, data):
+        return self.__pricer(self, option, data)
+
+
+def HestonCOSPricer(pricing_engine, option, data):
+    """
+    The Heston price of plain vanilla European calls and puts by the Fourier-cosine (COS) method.
+
+    The density of the log moneyness at expiry is expanded in a cosine series over a range set
+    by the first two cumulants of the log return. The series coefficients come from the
+    characteristic function, evaluated once for all the contracts that share an expiry,
+    rate, dividend and volatility; each strike then costs one dot product. Puts are priced
+    from the series, and calls by put-call parity, which is the numerically stable choice.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                a vanilla option payoff whose strike and expiry may be arrays
+        data (MarketData):              a market data variable via the MarketData interface; fields may be arrays
+
+    Returns the option price, or an array containing one price per contract.
+
+    """
+
+    (spot, rate, volatility, dividend) = data.get_data()
+    contracts = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (
+        spot, option.strike, option.expiry, rate, volatility, dividend, _call_put_sign(option))))
+    shape = contracts[0].shape
+    (spot, strike, expiry, rate, volatility, dividend, w) = (x.ravel() for x in contracts)
+    x = np.log(spot / strike)
+
+    (groups, inverse) = np.unique(np.column_stack((expiry, rate, volatility, dividend)), axis=0,
+                                  return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    put = np.empty(x.size)
+    for ((tau, r, vol, q), rows) in zip(groups, np.split(order, np.cumsum(np.bincount(inverse))[:-1])):
+        phi = functools.partial(_heston_characteristic_function, tau=tau, rate=r, dividend=q, v0=vol * vol,
+                                alpha=pricing_engine.alpha, Vbar=pricing_engine.Vbar, xi=pricing_engine.xi,
+                                rho=pricing_engine.rho)
+        put[rows] = strike[rows] * np.exp(-r * tau) * _cos_put(phi, x[rows], int(pricing_engine.terms),
+                                                               pricing_engine.truncation)
+
+    parity = np.where(w > 0, spot * np.exp(-dividend * expiry) - strike * np.exp(-rate * expiry), 0.0)
+    return (put + parity).reshape(shape)[()]
+
+
+def _heston_characteristic_function(u, tau, rate, dividend, v0, alpha, Vbar, xi, rho):
+    """
+    The characteristic function of the Heston log return log(S_tau / S_0), at the points u.
+
+    Written in the form of Albrecher et al. ("the little Heston trap"), which has no branch
+    cut discontinuities in the complex logarithm, with (beta - d) / xi^2 rewritten so that it
+    does not cancel as xi goes to zero (the Black-Scholes limit).
+
+    """
+
+    iu = 1j * u
+    beta = alpha - rho * xi * iu
+    d = np.sqrt(beta * beta + xi * xi * (iu + u * u))
+    m = -(iu + u * u) / (beta + d)
+    g = xi * xi * m / (beta + d)
+    edt = np.exp(-d * tau)
+    # log((1 - g edt) / (1 - g)) / xi^2 = log1p(y) / xi^2, with y / xi^2 computed directly
+    y_xi2 = m / (beta + d) * (1.0 - edt) / (1.0 - g)
+    y = xi * xi * y_xi2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(np.abs(y) < 1e-4, 1.0 - y / 2.0 + y * y / 3.0, np.log(1.0 + y) / y)
+    C = (rate - dividend) * iu * tau + alpha * Vbar * (m * tau - 2.0 * y_xi2 * ratio)
+    D = m * (1.0 - edt) / (1.0 - g * edt)
+    return np.exp(C + D * v0)
+
+
+def _cos_put(phi, x, terms, truncation):
+    """
+    The COS series value of a put per unit strike, undiscounted, at the log moneyness values x.
+
+    phi is the characteristic function of the log return. The integration range covers
+    truncation standard deviations of the log return either side of its mean, for every x.
+
+    """
+
+    h = 1e-3
+    logphi = np.log(phi(np.array([h])))[0]
+    c1 = logphi.imag / h
+    sd = np.sqrt(abs(2.0 * logphi.real) / (h * h))
+    a = x.min() + c1 - truncation * sd
+    b = x.max() + c1 + truncation * sd
+    d = min(max(0.0, a), b)
+
+    u = np.arange(terms) * np.pi / (b - a)
+    (sin_d, cos_d) = (np.sin(u * (d - a)), np.cos(u * (d - a)))
+    chi = (cos_d * np.exp(d) - np.exp(a) + u * sin_d * np.exp(d)) / (1.0 + u * u)
+    psi = np.empty(terms)
+    psi[0] = d - a
+    psi[1:] = sin_d[1:] / u[1:]
+    coefficients = phi(u) * np.exp(-1j * u * a) * 2.0 / (b - a) * (psi - chi)
+    coefficients[0] *= 0.5
+
+    return np.real(np.exp(1j * np.outer(x, u)) @ coefficients)
+
+
+FiniteDifferenceResult = collections.namedtuple('FiniteDifferenceResult', ['price', 'delta', 'gamma'])
+
+
+def _check_grid(space_steps, time_steps):
+    if int(space_steps) < 4:
+        raise ValueError("space_steps must be at least 4, not {0}".format(space_steps))
+    if int(time_steps) < 1:
+        raise ValueError("time_steps must be at least 1, not {0}".format(time_steps))
+
+
+class FiniteDifferencePricingEngine(PricingEngine):
+    """
+    A concrete PricingEngine class that solves the Black-Scholes PDE by finite differences.
+
+    The grid is uniform in log spot, centred on the spot and width standard deviations
+    wide on either side. For a barrier option the grid instead ends at the barrier. The first
+    rannacher_steps time steps are fully implicit to damp the oscillations a non-smooth payoff
+    sets off under Crank-Nicolson.
+
+    Args:
+        space_steps (int):     the number of log-spot intervals (rounded down to an even number; at least 4)
+        time_steps (int):      the number of time steps (at least 1)
+        pricer (function):     a finite-difference pricer (i.e. CrankNicolsonPricer)
+        width (float):         the half-width of the grid in standard deviations of log spot at expiry
+        rannacher_steps (int): the number of implicit start-up steps
+
+    """
+
+    def __init__(self, space_steps, time_steps, pricer, width=5.0, rannacher_steps=2):
+        _check_grid(space_steps, time_steps)
+        self.__space_steps = space_steps
+        self.__time_steps = time_steps
+        self.__pricer = pricer
+        self.__width = width
+        self.__rannacher_steps = rannacher_steps
+
+    @property
+    def space_steps(self):
+        return self.__space_steps
+
+    @space_steps.setter
+    def space_steps(self, new_space_steps):
+        _check_grid(new_space_steps, self.__time_steps)
+        self.__space_steps = new_space_steps
+        self._version += 1
+
+    @property
+    def time_steps(self):
+        return self.__time_steps
+
+    @time_steps.setter
+    def time_steps(self, new_time_steps):
+        _check_grid(self.__space_steps, new_time_steps)
+        self.__time_steps = new_time_steps
+        self._version += 1
+
+    @property
+    def width(self):
+        return self.__width
+
+    @width.setter
+    def width(self, new_width):
+        self.__width = new_width
+        self._version += 1
+
+    @property
+    def rannacher_steps(self):
+        return self.__rannacher_steps
+
+    @rannacher_steps.setter
+    def rannacher_steps(self, new_rannacher_steps):
+        self.__rannacher_steps = new_rannacher_steps
+        self._version += 1
+
+    @property
+    def pricer(self):
+        return self.__pricer
+
+    def work(self, option, data, result):
+        return ('nodes', (self.__space_steps + 1) * self.__time_steps)
+
+    def calculate(self, option, data):
+        return self.__pricer(self, option, data)
+
+
+def CrankNicolsonPricer(pricing_engine, option, data):
+    """
+    The Crank-Nicolson finite-difference model for a European option.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a FiniteDifferenceResult tuple of (price, delta, gamma).
+
+    """
+
+    return _crank_nicolson(pricing_engine, option, data, american=False)
+
+
+def AmericanCrankNicolsonPricer(pricing_engine, option, data):
+    """
+    The Crank-Nicolson finite-difference model for an American option.
+
+    Early exercise is enforced with a penalty method: at each time step the nodes below the
+    exercise value are penalized towards it, and the solve is repeated until that set settles.
+
+    Args:
+        pricing_engine (PricingEngine): a pricing method via the PricingEngine interface
+        option (Payoff):                an option payoff via the Payoff interface
+        data (MarketData):              a market data variable via the MarketData interface
+
+    Returns a FiniteDifferenceResult tuple of (price, delta, gamma).
+
+    """
+
+    return _crank_nicolson(pricing_engine, option, data, american=True)
+
+
+def _crank_nicolson(pricing_engine, option, data, american):
+    """
+    Step the option value back from expiry over the log-spot grid.
+
+    Each step is one tridiagonal solve over the interior nodes. The LAPACK factorization of
+    the left-hand matrix is made once per scheme (implicit and Crank-Nicolson) and reused at
+    every step. The boundary values are the discounted payoff of the forward price.
+
+    Barrier options are priced under continuous monitoring: a knock-out barrier is the edge of
+    the grid, where the value is held at zero, and a knock-in is the vanilla less the knock-out.
+    Other path-dependent payoffs raise ValueError.
+
+    """
+
+    if isinstance(option, BarrierPayoff):
+        return _barrier_crank_nicolson(pricing_engine, option, data, american)
+    if isinstance(option, ExoticPayoff):
+        raise ValueError("finite differences price vanilla and barrier payoffs, not {0}".format(
+            type(option).__name__))
+
+    return _log_spot_grid(pricing_engine, option.payoff, option.expiry, data, american)
+
+
+def _barrier_crank_nicolson(pricing_engine, option, data, american):
+    """
+    Price a barrier option on a grid whose edge is the barrier.
+
+    """
+
+    spot = data.get_data()[0]
+    up = option.knock.startswith('up')
+    vanilla = VanillaPayoff(option.expiry, option.strike, option.vanilla)
+    if option.knock.endswith('in'):
+        if american:
+            raise ValueError("American knock-in options are not supported")
+        out = BarrierPayoff(option.expiry, option.strike, option.barrier, option.knock[:-2] + 'out', option.vanilla)
+        (whole, knocked) = (_crank_nicolson(pricing_engine, vanilla, data, american),
+                            _crank_nicolson(pricing_engine, out, data, american))
+        return FiniteDifferenceResult(*np.subtract(whole, knocked))
+    if (spot >= option.barrier) if up else (spot <= option.barrier):
+        return FiniteDifferenceResult(0.0, 0.0, 0.0)
+
+    return _log_spot_grid(pricing_engine, vanilla.payoff, option.expiry, data, american, (option.barrier, up))
+
+
+def _log_spot_grid(pricing_engine, payoff, expiry, data, american, barrier=None):
+    """
+    Solve over a uniform log-spot grid with the spot on a node, and return the price, delta and gamma.
+
+    Without a barrier the grid is centred on the spot. With a (level, up) knock-out barrier
+    the same number of intervals is laid out so that the barrier is a node at one edge and
+    the other edge is about width standard deviations away.
+
+    """
+
+    from scipy.linalg import lapack  # imported here to keep dylan.engine quick to import
+
+    (spot, rate, volatility, dividend) = data.get_data()
+    half = int(pricing_engine.space_steps) // 2
+    steps = int(pricing_engine.time_steps)
+    reach = pricing_engine.width * volatility * np.sqrt(expiry)
+    dx = reach / half
+    (lower, upper) = (half, half)
+    if barrier is not None:
+        (level, up) = barrier
+        distance = abs(np.log(level / spot))
+        near = min(max(1, int(round(2 * half * distance / (distance + reach)))), 2 * half - 1)
+        dx = distance / near
+        (lower, upper) = (2 * half - near, near) if up else (near, 2 * half - near)
+    dt = expiry / steps
+    s = spot * np.exp(dx * np.arange(-lower, upper + 1))
+    m = lower + upper - 1
+
+    nu = rate - dividend - 0.5 * volatility * volatility
+    a = 0.5 * volatility * volatility / (dx * dx) - 0.5 * nu / dx
+    b = -volatility * volatility / (dx * dx) - rate
+    c = 0.5 * volatility * volatility / (dx * dx) + 0.5 * nu / dx
+
+    values = payoff(s).astype(float)
+    if barrier is not None:
+        values[-1 if up else 0] = 0.0
+    exercise = values[1:-1].copy()
+    factors = {}
+
+    for n in range(steps):
+        theta = 1.0 if n < pricing_engine.rannacher_steps else 0.5
+        if theta not in factors:
+            factors[theta] = lapack.dgttrf(np.full(m - 1, -theta * dt * a), np.full(m, 1.0 - theta * dt * b),
+                                           np.full(m - 1, -theta * dt * c))[:5]
+        tau = (n + 1) * dt
+        edge = np.exp(-rate * tau) * payoff(s[[0, -1]] * np.exp((rate - dividend) * tau))
+        if american:
+            edge = np.maximum(edge, payoff(s[[0, -1]]))
+        if barrier is not None:
+            edge[1 if up else 0] = 0.0
+
+        explicit = (1.0 - theta) * dt
+        rhs = values[1:-1] + explicit * (a * values[:-2] + b * values[1:-1] + c * values[2:])
+        rhs[0] += theta * dt * a * edge[0]
+        rhs[-1] += theta * dt * c * edge[1]
+        interior = lapack.dgttrs(*factors[theta], rhs)[0]
+
+        if american:
+            active = interior < exercise
+            for i in range(_PENALTY_ITERATIONS):
+                if not active.any():
+                    break
+                penalty = _PENALTY * active
+                (dl, d, du) = (np.full(m - 1, -theta * dt * a), 1.0 - theta * dt * b + penalty,
+                               np.full(m - 1, -theta * dt * c))
+                interior = lapack.dgttrs(*lapack.dgttrf(dl, d, du)[:5], rhs + penalty * exercise)[0]
+                if np.array_equal(interior < exercise, active):
+                    break
+                active = interior < exercise
+
+        values[1:-1] = interior
+        values[[0, -1]] = edge
+
+    vx = (values[lower + 1] - values[lower - 1]) / (2.0 * dx)
+    vxx = (values[lower + 1] - 2.0 * values[lower] + values[lower - 1]) / (dx * dx)
+
+    return FiniteDifferenceResult(values[lower], vx / spot, (vxx - vx) / (spot * spot))
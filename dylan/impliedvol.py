@@ -0,0 +1,68 @@
+import numpy as np
+from dylan.engine import _black_scholes_d1_d2, _call_put_sign, _ndtr
+
+
+def ImpliedVolatility(option, data, price, tol=1e-10, max_iter=100, bounds=(1e-6, 10.0)):
+    """
+    The Black-Scholes implied volatilities of a whole option chain.
+
+    Every contract is solved together with safeguarded Newton iterations that use vega.
+    Each contract keeps a bracket around its root; whenever a Newton step would leave that
+    bracket (or vega vanishes) the contract takes a bisection step instead. Contracts drop
+    out of later iterations as soon as they converge.
+
+    Args:
+        option (Payoff):    a vanilla option payoff whose strike and expiry may be arrays
+        data (MarketData):  market data whose volatility is the starting guess; fields may be arrays
+        price (array):      the quoted option prices
+        tol (float):        the price tolerance
+        max_iter (int):     the maximum number of iterations
+        bounds (tuple):     the lowest and highest volatility searched
+
+    Returns an array containing the implied volatilities. Quotes outside the no-arbitrage
+    bounds, or that do not converge, are NaN.
+
+    """
+
+    (spot, rate, guess, dividend) = data.get_data()
+    chain = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (
+        price, spot, option.strike, option.expiry, rate, dividend, guess, _call_put_sign(option))))
+    shape = chain[0].shape
+    (price, spot, strike, expiry, rate, dividend, guess, w) = (x.ravel() for x in chain)
+
+    sfwd = spot * np.exp(-dividend * expiry)
+    kdisc = strike * np.exp(-rate * expiry)
+    lower = np.maximum(w * (sfwd - kdisc), 0.0)
+    upper = np.where(w > 0, sfwd, kdisc)
+
+    vol = np.full(price.shape, np.nan)
+    lo = np.full(price.shape, bounds[0])
+    hi = np.full(price.shape, bounds[1])
+    sigma = np.clip(guess, bounds[0], bounds[1])
+    active = np.flatnonzero((price > lower) & (price < upper))
+
+    for i in range(max_iter):
+        if active.size == 0:
+            break
+        s = sigma[active]
+        (d1, d2) = _black_scholes_d1_d2(spot[active], strike[active], expiry[active], s, rate[active], dividend[active])
+        wa = w[active]
+        diff = wa * (sfwd[active] * _ndtr(wa * d1) - kdisc[active] * _ndtr(wa * d2)) - price[active]
+        vega = sfwd[active] * np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi) * np.sqrt(expiry[active])
+
+        done = np.abs(diff) < tol
+        vol[active[done]] = s[done]
+
+        hi[active] = np.where(diff > 0.0, s, hi[active])
+        lo[active] = np.where(diff < 0.0, s, lo[active])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = s - diff / vega
+        bisect = ~((step > lo[active]) & (step < hi[active]))
+        step[bisect] = 0.5 * (lo[active][bisect] + hi[active][bisect])
+        sigma[active] = step
+
+        stalled = hi[active] - lo[active] < tol
+        vol[active[stalled & ~done]] = step[stalled & ~done]
+        active = active[~(done | stalled)]
+
+    return vol.reshape(shape)
@@ -0,0 +1,163 @@
+"""
+Instrumentation for the pricing engines.
+
+Every PricingEngine.calculate is wrapped (see PricingEngine.__init_subclass__). While
+instrumentation is off the wrapper only checks one module flag before calling through, so
+it can stay in place in production. When it is on, each call records its wall time, the
+work it did (paths, nodes or contracts, from the engine's work method), the work rate and,
+optionally, the peak allocation above what was traced on entry. Calls go into the aggregated
+registry and to any callbacks:
+
+    with profiling() as stats:
+        option.price()
+    print(stats.to_json())
+
+"""
+
+import contextlib
+import functools
+import json
+import time
+import tracemalloc
+
+
+_enabled = False
+
+
+class StatsRegistry(object):
+    """
+    Aggregated call statistics per engine and pricer, plus per-call callbacks.
+
+    Each callback is called with a dict describing one call: engine, pricer, seconds,
+    unit, units and peak_memory_bytes (None unless memory tracking is on).
+
+    """
+
+    def __init__(self):
+        self.__stats = {}
+        self.__callbacks = []
+        self.__memory = False
+
+    @property
+    def enabled(self):
+        return _enabled
+
+    @property
+    def memory(self):
+        return self.__memory
+
+    def enable(self, memory=False):
+        """
+        Start recording calls; with memory=True also trace peak allocations (much slower).
+
+        """
+
+        global _enabled
+        self.__memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _enabled = True
+
+    def disable(self):
+        global _enabled
+        _enabled = False
+        if self.__memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.__memory = False
+
+    def reset(self):
+        self.__stats.clear()
+
+    def add_callback(self, callback):
+        self.__callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.__callbacks.remove(callback)
+
+    def record(self, call):
+        """
+        Add one call (a dict as passed to the callbacks) to the statistics.
+
+        """
+
+        key = "{0}/{1}".format(call['engine'], call['pricer'])
+        stats = self.__stats.get(key)
+        if stats is None:
+            stats = self.__stats[key] = {'engine': call['engine'], 'pricer': call['pricer'], 'calls': 0,
+                                         'seconds': 0.0, 'max_seconds': 0.0, 'unit': call['unit'], 'units': 0,
+                                         'peak_memory_bytes': None}
+        stats['calls'] += 1
+        stats['seconds'] += call['seconds']
+        stats['max_seconds'] = max(stats['max_seconds'], call['seconds'])
+        if call['units'] is not None:
+            stats['units'] += call['units']
+        if call['peak_memory_bytes'] is not None:
+            stats['peak_memory_bytes'] = max(stats['peak_memory_bytes'] or 0, call['peak_memory_bytes'])
+        for callback in self.__callbacks:
+            callback(call)
+
+    def stats(self):
+        """
+        The aggregated statistics as a dict keyed by 'Engine/Pricer'.
+
+        Each entry has calls, seconds, mean_seconds, max_seconds, unit, units,
+        units_per_second and peak_memory_bytes.
+
+        """
+
+        report = {}
+        for (key, stats) in self.__stats.items():
+            entry = dict(stats)
+            entry['mean_seconds'] = stats['seconds'] / stats['calls']
+            entry['units_per_second'] = stats['units'] / stats['seconds'] if stats['seconds'] > 0.0 else None
+            report[key] = entry
+        return report
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.stats(), **kwargs)
+
+
+registry = StatsRegistry()
+
+
+@contextlib.contextmanager
+def profiling(memory=False):
+    """
+    Record engine calls for the duration of a with block, yielding the registry.
+
+    """
+
+    registry.enable(memory)
+    try:
+        yield registry
+    finally:
+        registry.disable()
+
+
+def instrumented(calculate):
+    """
+    Wrap an engine's calculate method so that calls are recorded while instrumentation is on.
+
+    """
+
+    @functools.wraps(calculate)
+    def wrapper(engine, option, data):
+        if not _enabled:
+            return calculate(engine, option, data)
+
+        memory = registry.memory and tracemalloc.is_tracing()
+        if memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = calculate(engine, option, data)
+        seconds = time.perf_counter() - start
+
+        (unit, units) = engine.work(option, data, result) or (None, None)
+        pricer = getattr(engine, 'pricer', None)
+        registry.record({'engine': type(engine).__name__, 'pricer': getattr(pricer, '__name__', None),
+                         'seconds': seconds, 'unit': unit, 'units': units,
+                         'peak_memory_bytes': tracemalloc.get_traced_memory()[1] - baseline if memory else None})
+        return result
+
+    return wrapper
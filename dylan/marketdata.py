@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class MarketData(object):
     """
     A class to encapsulate market data variables. 
@@ -11,6 +14,8 @@ class MarketData(object):
 
     """
 
+    _version = 0
+
     def __init__(self, rate, spot, volatility, dividend):
         self.__rate = rate
         self.__spot = spot
@@ -24,6 +29,7 @@ class MarketData(object):
     @rate.setter
     def rate(self, new_rate):
         self.__rate = new_rate
+        self._version += 1
 
     @property
     def spot(self):
@@ -32,6 +38,7 @@ class MarketData(object):
     @spot.setter
     def spot(self, new_spot):
         self.__spot = new_spot
+        self._version += 1
 
     @property
     def volatility(self):
@@ -39,7 +46,8 @@ class MarketData(object):
 
     @volatility.setter
     def volatility(self, new_volatility):
-        self.__volatility = new_olatility
+        self.__volatility = new_volatility
+        self._version += 1
 
     @property
     def dividend(self):
@@ -48,7 +56,161 @@ class MarketData(object):
     @dividend.setter
     def dividend(self, new_yield):
         self.__dividend = new_yield
+        self._version += 1
         
+    @property
+    def version(self):
+        """
+        A counter that is bumped whenever one of the market data fields is set.
+
+        """
+
+        return self._version
+
     def get_data(self):
         return (self.__spot, self.__rate, self.__volatility, self.__dividend)
-    
+
+
+MARKET_DATA_DTYPE = np.dtype([('spot', 'f8'), ('rate', 'f8'), ('volatility', 'f8'), ('dividend', 'f8')])
+
+
+class MarketDataStore(object):
+    """
+    A columnar container of market data: one row per underlying, contract or scenario.
+
+    The rows live in a single NumPy structured array (MARKET_DATA_DTYPE), so there is no
+    Python object per row. get_data returns whole columns, so a store can stand in for a
+    MarketData anywhere the engines accept arrays (i.e. BlackScholesPricingEngine), and its
+    columns can be handed straight to the calculate_batch methods.
+
+    Args:
+        records (array): a structured array with the spot, rate, volatility and dividend fields
+
+    """
+
+    _version = 0
+
+    def __init__(self, records):
+        self.__records = records
+
+    @classmethod
+    def from_arrays(cls, spot, rate, volatility, dividend):
+        """
+        A store built from (broadcast) columns of spots, rates, volatilities and dividends.
+
+        """
+
+        columns = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (spot, rate, volatility, dividend)))
+        records = np.empty(columns[0].size, dtype=MARKET_DATA_DTYPE)
+        for (name, column) in zip(MARKET_DATA_DTYPE.names, columns):
+            records[name] = column.ravel()
+        return cls(records)
+
+    @classmethod
+    def from_term_structures(cls, spot, expiry, rate, volatility, dividend):
+        """
+        A store with one row per contract, reading each curve at the contract's expiry.
+
+        Under Black-Scholes dynamics with deterministic rates and volatilities a contract
+        depends only on the averages to its expiry, which is exactly what the curves return.
+        Any of rate, volatility and dividend may be a TermStructure or a flat value.
+
+        """
+
+        read = lambda curve: curve(expiry) if isinstance(curve, TermStructure) else curve
+        return cls.from_arrays(spot, read(rate), read(volatility), read(dividend))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load a store from a .npy file (memory-mapped) or a CSV file with a header row.
+
+        A CSV needs spot, rate, volatility and dividend columns, in any order and alongside
+        any other columns; it is parsed straight into the structured array. Save a large CSV
+        once as .npy to memory-map it from then on.
+
+        """
+
+        if path.endswith('.npy'):
+            return cls(np.load(path, mmap_mode=mmap_mode))
+        with open(path) as f:
+            header = [name.strip() for name in f.readline().split(',')]
+        usecols = [header.index(name) for name in MARKET_DATA_DTYPE.names]
+        return cls(np.loadtxt(path, delimiter=',', skiprows=1, usecols=usecols, dtype=MARKET_DATA_DTYPE, ndmin=1))
+
+    def save(self, path):
+        """
+        Save the store as a .npy file.
+
+        """
+
+        np.save(path, self.__records)
+
+    @property
+    def records(self):
+        return self.__records
+
+    @property
+    def spot(self):
+        return self.__records['spot']
+
+    @property
+    def rate(self):
+        return self.__records['rate']
+
+    @property
+    def volatility(self):
+        return self.__records['volatility']
+
+    @property
+    def dividend(self):
+        return self.__records['dividend']
+
+    @property
+    def version(self):
+        return self._version
+
+    def __len__(self):
+        return len(self.__records)
+
+    def __getitem__(self, index):
+        return MarketDataStore(np.atleast_1d(self.__records[index]))
+
+    def get_data(self):
+        return (self.spot, self.rate, self.volatility, self.dividend)
+
+
+class TermStructure(object):
+    """
+    A term structure curve of rates, dividend yields or volatilities.
+
+    Calling the curve with times to maturity returns the average value to each maturity.
+    Rates and yields are interpolated linearly in rate x time (flat forwards between the
+    pillars); volatilities (variance=True) linearly in total variance. The curve is flat
+    beyond its last pillar and before its first.
+
+    Args:
+        times (array):    the pillar maturities (in years, positive and increasing)
+        values (array):   the zero rates, yields or volatilities at the pillars
+        variance (bool):  interpolate in total variance (for volatilities)
+
+    """
+
+    def __init__(self, times, values, variance=False):
+        self.__times = np.asarray(times, dtype=float)
+        self.__values = np.asarray(values, dtype=float)
+        self.__variance = variance
+
+    @property
+    def times(self):
+        return self.__times
+
+    @property
+    def values(self):
+        return self.__values
+
+    def __call__(self, t):
+        t = np.clip(np.asarray(t, dtype=float), self.__times[0], self.__times[-1])
+        values = self.__values * self.__values if self.__variance else self.__values
+        average = np.interp(t, self.__times, values * self.__times) / t
+        return np.sqrt(average) if self.__variance else average
@@ -6,23 +6,42 @@ class Option(object):
         payoff (Payoff):        the option payoff function
         engine (PricingEngine): the option pricing method
         data (MarketData):      the market data 
+        cache (PricingCache):   an optional cache of prices (off by default)
 
     Methods:
-        price: returns a float containing the option price.
+        price: returns the option price, as computed by the engine's pricer.
 
     """
 
-    def __init__(self, payoff, engine, data):
+    def __init__(self, payoff, engine, data, cache=None):
         self.__payoff = payoff
         self.__engine = engine
         self.__data = data
+        self.__cache = cache
+
+    @property
+    def payoff(self):
+        return self.__payoff
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    @property
+    def data(self):
+        return self.__data
 
     def price(self):
         """
         The option price. 
 
-        Returns a float containing the option price.
+        Returns what the engine's pricer returns, so the type depends on the pricer: a float
+        (e.g. BlackScholesPricer, the binomial pricers), or a tuple led by the price, such as
+        (price, stderr) from NaiveMonteCarloPricer or the Greeks and finite difference results.
+        Array-valued market data gives arrays in place of floats.
 
         """
 
+        if self.__cache is not None:
+            return self.__cache.price(self.__payoff, self.__engine, self.__data)
         return self.__engine.calculate(self.__payoff, self.__data)
@@ -8,6 +8,17 @@ class Payoff(object, metaclass=abc.ABCMeta):
 
     """
 
+    _version = 0
+
+    @property
+    def version(self):
+        """
+        A counter that is bumped whenever one of the payoff's terms is set.
+
+        """
+
+        return self._version
+
     @property 
     @abc.abstractmethod
     def expiry(self):
@@ -50,6 +61,7 @@ class VanillaPayoff(Payoff):
     @expiry.setter
     def expiry(self, new_expiry):
         self.__expiry = new_expiry
+        self._version += 1
 
     @property
     def strike(self):
@@ -66,11 +78,67 @@ class VanillaPayoff(Payoff):
     @strike.setter
     def strike(self, new_strike):
         self.__strike = new_strike
+        self._version += 1
+
+    @property
+    def payoff_function(self):
+        """
+        The option's payoff function (i.e. call_payoff or put_payoff).
+
+        """
+
+        return self.__payoff
 
     def payoff(self, spot):
         return self.__payoff(self, spot)
+
+
+class BermudanPayoff(VanillaPayoff):
+    """
+    A plain vanilla option payoff that may also be exercised on a schedule of dates before expiry.
+
+    Args:
+        expiry (float):         the option's expiration date.
+        strike (int):           the option's strike price.
+        payoff (function):      the option's payoff function (via the strategy pattern)
+        exercise_dates (array): the early exercise dates (in years, between 0 and expiry)
+
+    """
+
+    def __init__(self, expiry, strike, payoff, exercise_dates):
+        super().__init__(expiry, strike, payoff)
+        self.__exercise_dates = exercise_dates
+
+    @property
+    def exercise_dates(self):
+        """
+        The option's early exercise dates.
+
+        """
+
+        return self.__exercise_dates
+
+    @exercise_dates.setter
+    def exercise_dates(self, new_exercise_dates):
+        self.__exercise_dates = new_exercise_dates
+        self._version += 1
+
         
 class ExoticPayoff(Payoff):
+    """
+    A path-dependent option payoff.
+
+    The payoff function sees whole price paths: spot is a (paths x steps + 1) array whose
+    first column is the spot price at inception, and the function reduces along the last
+    (time) axis to return one payoff per path. A single 1-d path works the same way.
+
+    Args:
+        expiry (float):    the option's expiration date.
+        strike (int):      the option's strike price.
+        payoff (function): the option's path payoff function (via the strategy pattern)
+
+    """
+
     def __init__(self, expiry, strike, payoff):
         self.__expiry = expiry
         self.__strike = strike
@@ -83,6 +151,7 @@ class ExoticPayoff(Payoff):
     @expiry.setter
     def expiry(self, new_expiry):
         self.__expiry = new_expiry
+        self._version += 1
     
     @property 
     def strike(self):
@@ -91,11 +160,86 @@ class ExoticPayoff(Payoff):
     @strike.setter
     def strike(self, new_strike):
         self.__strike = new_strike
+        self._version += 1
         
     def payoff(self, spot):
         return self.__payoff(self, spot)
 
 
+class BarrierPayoff(ExoticPayoff):
+    """
+    A knock-in or knock-out barrier option payoff.
+
+    A vanilla payoff on the terminal spot that is switched on (knock-in) or off (knock-out)
+    by whether the path touches the barrier. The barrier is monitored at every point of the path.
+
+    Args:
+        expiry (float):    the option's expiration date.
+        strike (int):      the option's strike price.
+        barrier (float):   the barrier level.
+        knock (str):       one of 'up-and-out', 'up-and-in', 'down-and-out' or 'down-and-in'
+        payoff (function): the vanilla payoff function at expiry (i.e. call_payoff or put_payoff)
+
+    """
+
+    def __init__(self, expiry, strike, barrier, knock, payoff):
+        if knock not in _KNOCKS:
+            raise ValueError("unknown barrier type: {0}".format(knock))
+        super().__init__(expiry, strike, _barrier_payoff)
+        self.__barrier = barrier
+        self.__knock = knock
+        self.__vanilla = payoff
+
+    @property
+    def barrier(self):
+        """
+        The option's barrier level.
+
+        """
+
+        return self.__barrier
+
+    @barrier.setter
+    def barrier(self, new_barrier):
+        self.__barrier = new_barrier
+        self._version += 1
+
+    @property
+    def knock(self):
+        """
+        The option's barrier type.
+
+        """
+
+        return self.__knock
+
+    @property
+    def vanilla(self):
+        """
+        The vanilla payoff function paid at expiry if the option is alive.
+
+        """
+
+        return self.__vanilla
+
+
+_KNOCKS = frozenset(['up-and-out', 'up-and-in', 'down-and-out', 'down-and-in'])
+
+
+def _barrier_payoff(option, spot):
+    """
+    The path payoff function behind BarrierPayoff.
+
+    """
+
+    if option.knock.startswith('up'):
+        hit = np.amax(spot, axis=-1) >= option.barrier
+    else:
+        hit = np.amin(spot, axis=-1) <= option.barrier
+    alive = ~hit if option.knock.endswith('out') else hit
+    return np.where(alive, option.vanilla(option, spot[..., -1]), 0.0)
+
+
 def call_payoff(option, spot):
     """
     The payoff function for a European call option. 
@@ -119,16 +263,16 @@ def put_payoff(option, spot):
 
     return maximum(option.strike - spot, 0.0)
     
-def Lookback_Call_Payoff(strike, spot):
+def Lookback_Call_Payoff(option, spot):
     """
     The payoff function for a European lookback call option. 
 
     Args:
         option:       the self variable from the Payoff class that aggregates the function.
-        spot (array): the price path of the underlying asset
+        spot (array): the price paths of the underlying asset, with time along the last axis
     """
     
-    return maximum(np.amax(spot) - strike, 0.0)
+    return maximum(np.amax(spot, axis=-1) - option.strike, 0.0)
     
 def Lookback_Put_Payoff(option, spot):
     """
@@ -136,9 +280,56 @@ def Lookback_Put_Payoff(option, spot):
 
     Args:
         option:       the self variable from the Payoff class that aggregates the function.
-        spot (array): the price path of the underlying asset
+        spot (array): the price paths of the underlying asset, with time along the last axis
     """
     
-    return maximum(option.strike - np.amin(spot), 0.0)
+    return maximum(option.strike - np.amin(spot, axis=-1), 0.0)
+
 
+def Arithmetic_Asian_Call_Payoff(option, spot):
+    """
+    The payoff function for a fixed-strike arithmetic average (Asian) call option.
+
+    Args:
+        option:       the self variable from the Payoff class that aggregates the function.
+        spot (array): the price paths of the underlying asset, with time along the last axis;
+                      the first column (the spot at inception) is not part of the average
+    """
+
+    return maximum(np.mean(spot[..., 1:], axis=-1) - option.strike, 0.0)
+
+def Arithmetic_Asian_Put_Payoff(option, spot):
+    """
+    The payoff function for a fixed-strike arithmetic average (Asian) put option.
+
+    Args:
+        option:       the self variable from the Payoff class that aggregates the function.
+        spot (array): the price paths of the underlying asset, with time along the last axis;
+                      the first column (the spot at inception) is not part of the average
+    """
+
+    return maximum(option.strike - np.mean(spot[..., 1:], axis=-1), 0.0)
+
+def Geometric_Asian_Call_Payoff(option, spot):
+    """
+    The payoff function for a fixed-strike geometric average (Asian) call option.
+
+    Args:
+        option:       the self variable from the Payoff class that aggregates the function.
+        spot (array): the price paths of the underlying asset, with time along the last axis;
+                      the first column (the spot at inception) is not part of the average
+    """
+
+    return maximum(np.exp(np.mean(np.log(spot[..., 1:]), axis=-1)) - option.strike, 0.0)
+
+def Geometric_Asian_Put_Payoff(option, spot):
+    """
+    The payoff function for a fixed-strike geometric average (Asian) put option.
+
+    Args:
+        option:       the self variable from the Payoff class that aggregates the function.
+        spot (array): the price paths of the underlying asset, with time along the last axis;
+                      the first column (the spot at inception) is not part of the average
+    """
 
+    return maximum(option.strike - np.exp(np.mean(np.log(spot[..., 1:]), axis=-1)), 0.0)
@@ -0,0 +1,67 @@
+import collections
+import copy
+import numpy as np
+from dylan.book import price_contracts
+
+
+ScenarioResult = collections.namedtuple('ScenarioResult', ['pnl', 'base', 'portfolio', 'var', 'es'])
+
+
+def ScenarioRevaluation(portfolio, shocks, quantities=None, confidence=0.99):
+    """
+    Revalue a portfolio of options under a matrix (or grid) of market data scenarios.
+
+    The last axis of shocks holds (spot, volatility, rate, dividend) shocks: the spot shock
+    is relative (spot * (1 + shock)) and the others are added. Engines that accept market data
+    arrays revalue a position under every scenario in one call; the rest are repriced one
+    scenario at a time, and engines with a seed are held on a single seed so that every
+    scenario sees the same random numbers.
+
+    Args:
+        portfolio (list):    the positions, as Option objects
+        shocks (array):      a (... x 4) array of scenarios, i.e. (scenarios x 4) or (spot x vol x 4)
+        quantities (array):  the number of contracts held in each position (default one each)
+        confidence (float):  the confidence level of the VaR and expected shortfall
+
+    Returns a ScenarioResult tuple of (pnl, base, portfolio, var, es): the (positions x ...)
+    P&L cube, the base position values, the portfolio P&L per scenario, and the value at risk
+    and expected shortfall of the portfolio P&L (as positive losses).
+
+    """
+
+    shocks = np.asarray(shocks, dtype=float)
+    shape = shocks.shape[:-1]
+    (dspot, dvolatility, drate, ddividend) = shocks.reshape(-1, 4).T
+    quantities = np.ones(len(portfolio)) if quantities is None else np.asarray(quantities, dtype=float)
+
+    base = np.empty(len(portfolio))
+    values = np.empty((len(portfolio), dspot.size))
+    for (i, option) in enumerate(portfolio):
+        (spot, rate, volatility, dividend) = option.data.get_data()
+        scenarios = (spot * (1.0 + dspot), rate + drate, volatility + dvolatility, dividend + ddividend)
+        engine = _common_random_numbers(option.engine)
+        base[i] = price_contracts(engine, option.payoff, spot, rate, volatility, dividend)[0]
+        values[i] = price_contracts(engine, option.payoff, *scenarios)
+
+    pnl = values - base[:, np.newaxis]
+    total = quantities @ pnl
+    var = -np.quantile(total, 1.0 - confidence)
+    es = -total[total <= -var].mean()
+
+    return ScenarioResult(pnl.reshape((len(portfolio),) + shape), base, total.reshape(shape), var, es)
+
+
+def _common_random_numbers(engine):
+    """
+    The engine held on one seed for a revaluation: the engine itself if it has a seed (or
+    none is needed), else a copy pinned to fresh entropy, so the caller's engine is left alone.
+
+    """
+
+    if not hasattr(engine, 'seed') or engine.seed is not None:
+        return engine
+    if getattr(engine, 'workers', 1) > 1:
+        engine.executor  # create the engine's pool now so that the copy shares it
+    engine = copy.copy(engine)
+    engine.seed = np.random.SeedSequence().entropy
+    return engine
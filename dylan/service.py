@@ -0,0 +1,322 @@
+"""
+An asyncio quote service that micro-batches requests into vectorized engine calls.
+
+Quotes may be requested in process (await service.quote(...)) or over a local socket that
+speaks one JSON object per line. Requests that arrive within window seconds of each other are
+priced together in one batched engine call, run in an executor so that the event loop stays
+responsive:
+
+    async with QuoteService(BlackScholesPricingEngine(BlackScholesPricer)) as service:
+        server = await service.serve('127.0.0.1', 8765)
+        price = await service.quote('call', 41.0, 40.0, 1.0, 0.08, 0.30, 0.0)
+
+A socket request looks like {"id": 1, "payoff": "call", "spot": 41.0, "strike": 40.0,
+"expiry": 1.0, "rate": 0.08, "volatility": 0.3, "dividend": 0.0} and is answered with
+{"id": 1, "price": 6.96} (or {"id": 1, "error": "..."}); {"op": "stats"} returns the stats.
+
+"""
+
+import asyncio
+import collections
+import json
+
+import numpy as np
+
+from dylan.book import PAYOFFS, price_book
+
+
+QuoteRequest = collections.namedtuple('QuoteRequest', ['payoff', 'spot', 'strike', 'expiry', 'rate', 'volatility',
+                                                       'dividend'])
+"""
+One quote request.
+
+Attributes:
+    payoff (str):       'call' or 'put'
+    spot (float):       the underlying asset cash price
+    strike (float):     the option strike price
+    expiry (float):     the option expiration date
+    rate (float):       the risk-free rate
+    volatility (float): the underlying asset volatility
+    dividend (float):   the dividend yield
+
+"""
+
+
+class QuoteService(object):
+    """
+    Price concurrent quote requests in micro-batches.
+
+    Args:
+        engine (PricingEngine): the pricing engine; vectorized engines price a whole batch in one
+                                call, the rest are called once per request (in the executor)
+        window (float):         how long (in seconds) to collect requests after the first one
+        max_batch (int):        the largest number of requests priced in one call
+        executor (Executor):    where batches run; None uses the event loop's default executor
+        history (int):          the number of recent request latencies kept for the stats
+
+    """
+
+    def __init__(self, engine, window=0.002, max_batch=10000, executor=None, history=10000):
+        self.__engine = engine
+        self.__window = window
+        self.__max_batch = max_batch
+        self.__executor = executor
+        self.__latencies = collections.deque(maxlen=history)
+        self.__queue = None
+        self.__worker = None
+        self.__batch = []
+        self.__requests = 0
+        self.__batches = 0
+        self.__max_depth = 0
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    @property
+    def window(self):
+        return self.__window
+
+    @property
+    def max_batch(self):
+        return self.__max_batch
+
+    @property
+    def queue_depth(self):
+        """
+        The number of requests waiting to join a batch.
+
+        """
+
+        return self.__queue.qsize() if self.__queue is not None else 0
+
+    async def start(self):
+        if self.__worker is None:
+            self.__queue = asyncio.Queue()
+            self.__worker = asyncio.get_running_loop().create_task(self.__batcher())
+
+    async def stop(self):
+        """
+        Stop batching. Quotes still queued or in the running batch raise RuntimeError.
+
+        """
+
+        if self.__worker is not None:
+            self.__worker.cancel()
+            try:
+                await self.__worker
+            except asyncio.CancelledError:
+                pass
+            self.__worker = None
+            error = RuntimeError("quote service stopped")
+            while not self.__queue.empty():
+                self.__batch.append(self.__queue.get_nowait())
+            for (request, future, start) in self.__batch:
+                if not future.done():
+                    future.set_exception(error)
+            self.__batch = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def quote(self, payoff, spot, strike, expiry, rate, volatility, dividend):
+        """
+        The price of one contract, priced in the next batch.
+
+        Raises ValueError for an unknown payoff name, and RuntimeError if the service is not running.
+
+        """
+
+        if payoff not in PAYOFFS:
+            raise ValueError("unknown payoff: {0}".format(payoff))
+        if self.__worker is None:
+            raise RuntimeError("quote service is not running")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request = QuoteRequest(payoff, float(spot), float(strike), float(expiry), float(rate), float(volatility),
+                               float(dividend))
+        self.__queue.put_nowait((request, future, loop.time()))
+        self.__max_depth = max(self.__max_depth, self.__queue.qsize())
+        return await future
+
+    def stats(self):
+        """
+        The service statistics as a JSON-ready dict.
+
+        Includes the request and batch counts, the mean batch size, the current and largest
+        queue depth, and latency percentiles (in seconds) over the recent requests.
+
+        """
+
+        latencies = np.array(self.__latencies)
+        report = {'requests': self.__requests, 'batches': self.__batches,
+                  'mean_batch_size': self.__requests / self.__batches if self.__batches else None,
+                  'queue_depth': self.queue_depth, 'max_queue_depth': self.__max_depth}
+        for q in (50, 90, 99):
+            report['latency_p{0}'.format(q)] = float(np.percentile(latencies, q)) if latencies.size else None
+        return report
+
+    async def serve(self, host='127.0.0.1', port=0):
+        """
+        Start answering JSON-lines requests on a local TCP socket.
+
+        Returns the asyncio Server; port 0 picks a free port (see server.sockets).
+
+        """
+
+        await self.start()
+        return await asyncio.start_server(self.__handle, host, port)
+
+    async def __batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self.__batch = [await self.__queue.get()]
+            await asyncio.sleep(self.__window)
+            while len(batch) < self.__max_batch and not self.__queue.empty():
+                batch.append(self.__queue.get_nowait())
+
+            requests = [request for (request, future, start) in batch]
+            try:
+                prices = await loop.run_in_executor(self.__executor, _price_requests, self.__engine, requests)
+            except Exception as error:
+                for (request, future, start) in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                self.__batch = []
+                continue
+
+            now = loop.time()
+            for ((request, future, start), price) in zip(batch, prices):
+                if not future.done():
+                    future.set_result(float(price))
+                self.__latencies.append(now - start)
+            self.__batch = []
+            self.__requests += len(batch)
+            self.__batches += 1
+
+    async def __handle(self, reader, writer):
+        lock = asyncio.Lock()
+        pending = set()
+
+        async def answer(message):
+            try:
+                if message.get('op') == 'stats':
+                    reply = {'id': message.get('id'), 'stats': self.stats()}
+                else:
+                    price = await self.quote(*(message[field] for field in QuoteRequest._fields))
+                    reply = {'id': message.get('id'), 'price': price}
+            except Exception as error:
+                reply = {'id': message.get('id'), 'error': str(error) or type(error).__name__}
+            async with lock:
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("a request must be a JSON object")
+                except ValueError as error:
+                    async with lock:
+                        writer.write((json.dumps({'id': None, 'error': str(error)}) + "\n").encode())
+                    continue
+                task = asyncio.ensure_future(answer(message))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            writer.close()
+
+
+class QuoteClient(object):
+    """
+    A client for a QuoteService socket that pipelines many requests over one connection.
+
+    Args:
+        host (str): the service host
+        port (int): the service port
+
+    """
+
+    def __init__(self, host, port):
+        self.__host = host
+        self.__port = port
+        self.__reader = None
+        self.__writer = None
+        self.__listener = None
+        self.__pending = {}
+        self.__next_id = 0
+
+    async def connect(self):
+        (self.__reader, self.__writer) = await asyncio.open_connection(self.__host, self.__port)
+        self.__listener = asyncio.get_running_loop().create_task(self.__listen())
+
+    async def close(self):
+        self.__writer.close()
+        await self.__listener
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def quote(self, payoff, spot, strike, expiry, rate, volatility, dividend):
+        """
+        The price of one contract. Raises ValueError if the service rejects the request.
+
+        """
+
+        reply = await self.__request(dict(zip(QuoteRequest._fields,
+                                              (payoff, spot, strike, expiry, rate, volatility, dividend))))
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return reply['price']
+
+    async def stats(self):
+        return (await self.__request({'op': 'stats'}))['stats']
+
+    async def __request(self, message):
+        self.__next_id += 1
+        message['id'] = self.__next_id
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[self.__next_id] = future
+        self.__writer.write((json.dumps(message) + "\n").encode())
+        await self.__writer.drain()
+        return await future
+
+    async def __listen(self):
+        while True:
+            line = await self.__reader.readline()
+            if not line:
+                break
+            reply = json.loads(line)
+            future = self.__pending.pop(reply['id'], None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+        for future in self.__pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("quote service connection closed"))
+        self.__pending.clear()
+
+
+def _price_requests(engine, requests):
+    """
+    Price a batch of quote requests, one engine call per payoff type where the engine allows.
+
+    Returns an array containing the prices, in request order.
+
+    """
+
+    columns = np.array([request[1:] for request in requests], dtype=float)
+    return price_book(engine, [request.payoff for request in requests], *columns.T)
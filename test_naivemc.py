@@ -18,8 +18,8 @@ def main():
     the_data = MarketData(rate, spot, volatility, dividend)
 
     the_option = Option(the_call, the_nmc, the_data)
-    fmt = "The call option price is {0:0.3f}"
-    print(fmt.format(the_option.price()))
+    fmt = "The call option price is {0:0.3f} (stderr {1:0.4f})"
+    print(fmt.format(*the_option.price()))
 
 
 if __name__ == "__main__":